@@ -1,20 +1,78 @@
+import math
+from collections import OrderedDict
 import torch
 import torch.nn as nn
 import matplotlib.pyplot as plt
 import torch.optim as optim
-import networkx as nx
-from torch_geometric.utils import from_networkx
-from torch_geometric.nn import GATConv
+from torch_geometric.data import Data
 from torch_geometric.nn import GATConv
+from torch_geometric.utils import softmax
+
+# Each node receives messages from its k nearest neighbors
+NEIGHBORS = 10
+# Number of instances whose Data objects graph_to_data keeps
+_DATA_CACHE_SIZE = 1024
+_data_cache = OrderedDict()
+
+
+def graph_to_data(graph, k=NEIGHBORS):
+    """PyG Data for an EuclideanTSPGraph: x holds the coordinates scaled into the unit
+    square, edge_index the directed kNN edges (neighbor -> node) from graph.neighbors(k)
+    and edge_attr their scaled lengths. Node i is graph.node_ids[i]. Results are cached
+    by graph.labelled_fingerprint(), since the rows follow the graph's node order."""
+    key = (graph.labelled_fingerprint(), k)
+    data = _data_cache.get(key)
+    if data is not None:
+        _data_cache.move_to_end(key)
+        return data
+
+    coords = graph.coords
+    low = coords.min(axis=0) if graph.dimension else 0.0
+    scale = float((coords.max(axis=0) - low).max()) if graph.dimension else 0.0
+    x = torch.as_tensor((coords - low) / (scale or 1.0), dtype=torch.float)
+    neighbors = torch.tensor(graph.neighbors(k), dtype=torch.long)  # a copy: the graph caches a read-only array
+    targets = torch.arange(graph.dimension).repeat_interleave(neighbors.shape[1])
+    edge_index = torch.stack((neighbors.reshape(-1), targets))
+    edge_attr = (x[edge_index[0]] - x[edge_index[1]]).norm(dim=1, keepdim=True)
+    data = Data(x=x, edge_index=edge_index, edge_attr=edge_attr)
+
+    _data_cache[key] = data
+    if len(_data_cache) > _DATA_CACHE_SIZE:
+        _data_cache.popitem(last=False)
+    return data
+
+
+class PointerAttention(nn.Module):
+    """Scores every node as the next stop given the graph, first and current node embeddings."""
+
+    def __init__(self, hidden_dim=128, clip=10.0):
+        super().__init__()
+        self.query = nn.Linear(3 * hidden_dim, hidden_dim)
+        self.key = nn.Linear(hidden_dim, hidden_dim, bias=False)
+        self.clip = clip  # logits are clip * tanh(.) as in Bello et al.
+
+    def forward(self, keys, graph, first, current):
+        # keys: [batch, n, hidden] from self.key; graph, first, current: [batch, hidden]
+        query = self.query(torch.cat((graph, first, current), dim=-1))
+        scores = torch.einsum("bnd,bd->bn", keys, query) / math.sqrt(keys.shape[-1])
+        return self.clip * torch.tanh(scores)
+
 
 class PointerNetGNN(nn.Module):
     def __init__(self, input_dim=2, hidden_dim=128):
         super().__init__()
-        self.encoder = GATConv(input_dim, hidden_dim)
+        self.encoder = GATConv(input_dim, hidden_dim, edge_dim=1)  # edge_attr: edge lengths
         self.decoder = nn.Linear(hidden_dim, 1)  # Scores for selection
+        self.pointer = PointerAttention(hidden_dim)  # Step-wise scores for autoregressive decoding
+
+    def embed(self, data):
+        return self.encoder(data.x, data.edge_index, data.edge_attr)  # GNN encoding
+
+    def logits(self, data):
+        return self.decoder(self.embed(data)).squeeze(-1)  # [num_nodes]
 
     def forward(self, data):
-        x = self.encoder(data.x, data.edge_index)  # GNN encoding
-        logits = self.decoder(x).squeeze(-1)  # [num_nodes]
-        probs = torch.softmax(logits, dim=0)
+        # Normalized per graph, so a PyG Batch gives one distribution per instance
+        logits = self.logits(data)
+        probs = torch.softmax(logits, dim=0) if data.batch is None else softmax(logits, data.batch)
         return probs  # Probabilities for RL sampling
\ No newline at end of file
@@ -1,22 +1,166 @@
+import math
 import torch.optim as optim
 import torch
 import matplotlib.pyplot as plt
 import torch.optim as optim
-import networkx as nx
-from torch_geometric.utils import from_networkx
 import torch.nn as nn
 from torch_geometric.nn import GATConv
+from torch_geometric.utils import to_dense_batch
+from torch_geometric.data import Batch
 import torch.nn.functional as F
+from PtrNetwork import PointerNetGNN
+from seeds import int_seed
+
+# Logit given to the padding slots of a dense batch; finite so padded terms keep finite gradients
+_PAD_LOGIT = -1e9
+
+
+def sample_tours(logits, mask, greedy=False, generator=None):
+    """Tours [batch, n] and their log-probabilities [batch] for padded logits [batch, n].
+
+    Drawing nodes without replacement in proportion to softmax(logits) is the
+    Plackett-Luce distribution, so every tour is sampled at once as the order of
+    the Gumbel-perturbed logits (greedy: of the logits themselves), and its
+    log-probability is a sum of log-softmaxes over the nodes still unvisited.
+    """
+    logits = logits.masked_fill(~mask, _PAD_LOGIT)
+    scores = logits.detach()
+    if not greedy:
+        uniform = torch.rand(logits.shape, generator=generator, device=logits.device)
+        scores = scores - torch.log(-torch.log(uniform.clamp(min=torch.finfo(uniform.dtype).tiny)))
+    tours = torch.argsort(scores, dim=1, descending=True, stable=True)  # padding sorts last
+    chosen = logits.gather(1, tours)
+    remaining = torch.logcumsumexp(chosen.flip(1), dim=1).flip(1)
+    steps = torch.arange(mask.shape[1], device=mask.device) < mask.sum(1, keepdim=True)
+    log_probs = torch.where(steps, chosen - remaining, torch.zeros_like(chosen)).sum(1)
+    return tours, log_probs
+
+
+def tour_lengths(coords, tours, mask):
+    """Closed tour lengths [batch] for padded coords [batch, n, 2] and tours [batch, n]."""
+    ordered = coords.gather(1, tours.unsqueeze(-1).expand(-1, -1, coords.shape[-1]))
+    counts = mask.sum(1, keepdim=True)
+    following = torch.arange(1, tours.shape[1] + 1, device=tours.device).expand_as(tours)
+    following = torch.where(following < counts, following, torch.zeros_like(following))
+    legs = (ordered.gather(1, following.unsqueeze(-1).expand_as(ordered)) - ordered).norm(dim=-1)
+    steps = torch.arange(tours.shape[1], device=tours.device) < counts
+    return torch.where(steps, legs, torch.zeros_like(legs)).sum(1)
+
+
+def decode_tours(model, batch, mode="sample", beam_width=4, generator=None):
+    """Autoregressive tours from model.pointer, every tour starting at node 0.
+
+    Each of the n - 1 batched steps scores the nodes from the current node,
+    masks the visited ones and renormalizes. mode is "sample", "greedy" or
+    "beam" (beam_width partial tours per instance; the shortest finished one
+    wins). Returns tours [batch, n], their log-probabilities [batch], the mean
+    step entropy and the padding mask [batch, n].
+    """
+    embeddings, mask = to_dense_batch(model.embed(batch), batch.batch)
+    coords, _ = to_dense_batch(batch.x, batch.batch)
+    size, n, _ = embeddings.shape
+    width = beam_width if mode == "beam" else 1
+    beams = (embeddings, mask, coords)
+    if width > 1:
+        beams = tuple(tensor.repeat_interleave(width, dim=0) for tensor in beams)
+    embeddings, beam_mask, beam_coords = beams
+    counts = beam_mask.sum(1)
+    rows = torch.arange(len(embeddings), device=embeddings.device)
+
+    keys = model.pointer.key(embeddings)
+    graph = (embeddings * beam_mask.unsqueeze(-1)).sum(1) / counts.unsqueeze(-1)
+    first = embeddings[:, 0]
+    tours = torch.zeros(beam_mask.shape, dtype=torch.long, device=embeddings.device)
+    visited = ~beam_mask  # padding is never available
+    visited[:, 0] = True
+    current = tours[:, 0]
+    log_probs = torch.zeros(len(embeddings), device=embeddings.device)
+    scores = torch.zeros(size, width, device=embeddings.device)
+    scores[:, 1:] = -math.inf  # all beams start identical; keep one
+    scores = scores.view(-1)
+    entropy = torch.zeros((), device=embeddings.device)
+    first_column = torch.arange(n, device=embeddings.device) == 0
+
+    for step in range(1, n):
+        active = step < counts  # instances shorter than n are done early
+        logits = model.pointer(keys, graph, first, embeddings[rows, current]).masked_fill(visited, -math.inf)
+        # Finished rows have nothing left; they stay on node 0 with probability 1
+        logits = torch.where(~active.unsqueeze(1) & first_column, torch.zeros_like(logits), logits)
+        step_log_probs = torch.log_softmax(logits, dim=-1)
+
+        if mode == "beam":
+            candidates = (scores.unsqueeze(1) + step_log_probs).view(size, width * n)
+            top, index = candidates.topk(width, dim=1)
+            parent = (index // n + torch.arange(size, device=index.device).unsqueeze(1) * width).view(-1)
+            chosen = (index % n).view(-1)
+            scores = top.view(-1)
+            tours, visited, log_probs = tours[parent], visited[parent], log_probs[parent]
+            step_log_probs = step_log_probs[parent]
+        else:
+            if mode == "greedy":
+                chosen = step_log_probs.argmax(dim=-1)
+            elif mode == "sample":
+                chosen = torch.multinomial(step_log_probs.exp(), 1, generator=generator).squeeze(-1)
+            else:
+                raise ValueError(f"Unknown decoding mode: {mode}")
+            step_entropy = -(step_log_probs.exp() * step_log_probs.masked_fill(visited, 0)).sum(-1)
+            entropy = entropy + torch.where(active, step_entropy, torch.zeros_like(step_entropy)).sum()
+
+        chosen_log_probs = step_log_probs.gather(1, chosen.unsqueeze(1)).squeeze(1)
+        log_probs = log_probs + torch.where(active, chosen_log_probs, torch.zeros_like(chosen_log_probs))
+        tours = tours.clone()
+        tours[:, step] = chosen
+        visited = visited.clone()
+        visited[rows, chosen] = True
+        current = chosen
+
+    if width > 1:
+        lengths = tour_lengths(beam_coords, tours, beam_mask).masked_fill(torch.isinf(scores), math.inf)
+        best = lengths.view(size, width).argmin(dim=1) + torch.arange(size, device=lengths.device) * width
+        tours, log_probs = tours[best], log_probs[best]
+    entropy = entropy / (mask.sum() - size).clamp(min=1)
+    return tours, log_probs, entropy, mask
+
 
 class TSPAgent:
-    def __init__(self, model, lr=1e-3, device='cpu', entropy_weight=0.01):
+    def __init__(self, model, lr=1e-3, device='cpu', entropy_weight=0.01, seed=None, decoder="static"):
         # Automatically assign device to 'cuda' if available, else 'cpu'
         self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = model.to(self.device)  # Move the model to the correct device
         self.optimizer = optim.Adam(model.parameters(), lr=lr)
         self.entropy_weight = entropy_weight  # Regularization term
+        # "static": one distribution over all nodes per instance; "pointer": masked
+        # autoregressive decoding conditioned on the current node (decode_tours)
+        self.decoder = decoder
+        self.steps = 0  # train_step() calls so far
+        self.reseed(seed)
+
+    def save(self, path):
+        """Checkpoint the model weights with what is needed to rebuild it."""
+        torch.save({"model": self.model.state_dict(), "input_dim": self.model.encoder.in_channels,
+                    "hidden_dim": self.model.decoder.in_features, "decoder": self.decoder}, path)
+
+    @classmethod
+    def load(cls, path, device='cpu', **kwargs):
+        """Agent with the PointerNetGNN of a checkpoint written by save()."""
+        checkpoint = torch.load(path, map_location=device, weights_only=True)
+        model = PointerNetGNN(checkpoint["input_dim"], checkpoint["hidden_dim"])
+        model.load_state_dict(checkpoint["model"])
+        kwargs.setdefault("decoder", checkpoint["decoder"])
+        return cls(model, device=device, **kwargs)
+
+    def reseed(self, seed):
+        # Tours are sampled from this generator rather than torch's global one
+        self.generator = torch.Generator(device=self.device)
+        if seed is None:
+            self.generator.seed()
+        else:
+            self.generator.manual_seed(int_seed(seed))
 
     def sample_solution(self, data):
+        if self.decoder == "pointer":
+            tours, log_probs, entropy, _ = decode_tours(self.model, data, "sample", generator=self.generator)
+            return tours[0].tolist(), log_probs, entropy
         probs = self.model(data)
         dist = torch.distributions.Categorical(probs)
         tour = []
@@ -24,9 +168,9 @@ class TSPAgent:
         visited = set()
 
         for _ in range(len(probs)):
-            choice = dist.sample()
+            choice = torch.multinomial(probs, 1, generator=self.generator)[0]
             while int(choice) in visited:
-                choice = dist.sample()
+                choice = torch.multinomial(probs, 1, generator=self.generator)[0]
             visited.add(int(choice))
             tour.append(int(choice))
             log_probs.append(dist.log_prob(choice))
@@ -36,24 +180,20 @@ class TSPAgent:
         return tour, log_probs, entropy
 
     def compute_tour_length(self, tour, coords):
-        length = 0.0
-        for i in range(len(tour)):
-            a = coords[tour[i]]
-            b = coords[tour[(i + 1) % len(tour)]]
-            length += torch.norm(a - b)
-        return length
-
-    def train_step(self, data):
+        ordered = coords[torch.as_tensor(tour, device=coords.device)]
+        return torch.norm(ordered.roll(-1, dims=0) - ordered, dim=1).sum()
+
+    def train_step(self, data, log_every=None):
+        # One REINFORCE step on a single instance; the reward is printed every log_every steps
         self.model.train()
         self.optimizer.zero_grad()
         tour, log_probs, entropy = self.sample_solution(data)
         coords = data.x
         reward = -self.compute_tour_length(tour, coords)
 
-        # Debugging: Print the reward and tour length
-        #if reward < 0:
-            #print(f"Negative reward (which is correct): {reward}")
-        print(f"Current reward: {reward.item()}")
+        self.steps += 1
+        if log_every and self.steps % log_every == 0:
+            print(f"Step {self.steps}: reward {reward.item():.4f}")
 
         # REINFORCE loss with entropy regularization
         loss = -reward * log_probs.sum() + self.entropy_weight * entropy
@@ -63,4 +203,67 @@ class TSPAgent:
         torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
 
         self.optimizer.step()
-        return tour, -reward.item()
\ No newline at end of file
+        return tour, -reward.item()
+
+    def train_batch(self, batch, baseline="mean"):
+        """One REINFORCE step on a PyG Batch of instances, returning their mean sampled tour length.
+
+        baseline is "mean" (the batch's mean tour length) or "greedy" (each
+        instance's greedy tour under the current policy, i.e. self-critical).
+        """
+        self.model.train()
+        self.optimizer.zero_grad()
+        batch = batch.to(self.device)
+        coords, _ = to_dense_batch(batch.x, batch.batch)
+        if self.decoder == "pointer":
+            tours, log_probs, entropy, mask = decode_tours(self.model, batch, "sample", generator=self.generator)
+        else:
+            logits, mask = to_dense_batch(self.model.logits(batch), batch.batch)
+            tours, log_probs = sample_tours(logits, mask, generator=self.generator)
+            node_log_probs = torch.log_softmax(logits.masked_fill(~mask, _PAD_LOGIT), dim=1).masked_fill(~mask, 0)
+            entropy = -(node_log_probs.exp() * node_log_probs).sum(1).mean()  # Mean entropy for regularization
+        lengths = tour_lengths(coords, tours, mask)
+
+        with torch.no_grad():
+            if baseline == "greedy":
+                base = tour_lengths(coords, self.decode(batch, "greedy")[0], mask)
+            elif baseline == "mean":
+                base = lengths.mean()
+            else:
+                raise ValueError(f"Unknown baseline: {baseline}")
+
+        # REINFORCE loss with entropy regularization, as in train_step
+        loss = ((lengths - base).detach() * log_probs).mean() + self.entropy_weight * entropy
+        loss.backward()
+
+        # Gradient clipping to avoid exploding gradients
+        torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
+
+        self.optimizer.step()
+        return lengths.mean().item()
+
+    def decode(self, batch, mode="greedy", beam_width=4):
+        """Tours [batch, n] and the padding mask [batch, n] for a PyG Data or Batch.
+
+        mode is "greedy" or "sample", or "beam" with the pointer decoder.
+        """
+        batch = batch.to(self.device)
+        if self.decoder == "pointer":
+            tours, _, _, mask = decode_tours(self.model, batch, mode, beam_width, self.generator)
+            return tours, mask
+        if mode not in ("greedy", "sample"):
+            raise ValueError(f"The static decoder does not support {mode} decoding.")
+        logits, mask = to_dense_batch(self.model.logits(batch), batch.batch)
+        return sample_tours(logits, mask, greedy=mode == "greedy", generator=self.generator)[0], mask
+
+    def fit(self, data_list, epochs=1, batch_size=64, baseline="mean", log_every=None):
+        """Train on a list of PyG Data instances in shuffled batches; returns each batch's mean tour length."""
+        history = []
+        for epoch in range(epochs):
+            order = torch.randperm(len(data_list), generator=self.generator, device=self.device).tolist()
+            for start in range(0, len(order), batch_size):
+                batch = Batch.from_data_list([data_list[i] for i in order[start:start + batch_size]])
+                history.append(self.train_batch(batch, baseline))
+                if log_every and len(history) % log_every == 0:
+                    print(f"Epoch {epoch + 1}, batch {len(history)}: mean tour length {history[-1]:.4f}")
+        return history
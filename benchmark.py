@@ -0,0 +1,245 @@
+import os
+import gc
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from graph import EuclideanTSPGraph, unique_points, write_atomic
+from optimal import OptimalCostStore
+from exact import DynamicProgrammingSolver, BranchAndBoundSolver
+from heuristic import NearestNeighborSolver, GreedySolver, RandomizedSolver
+
+BENCHMARK_DIR = "results/benchmark"
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# Solver name -> (factory, smallest n, largest n); sizes run geometrically between the two
+SOLVERS = {
+    "NearestNeighborSolver": (lambda: NearestNeighborSolver(0), 16, 8192),
+    "GreedySolver": (lambda: GreedySolver(0), 16, 8192),
+    "RandomizedSolver": (lambda: RandomizedSolver(0), 16, 8192),
+    "DynamicProgrammingSolver": (DynamicProgrammingSolver, 4, 16),
+    # A node budget instead of a time limit keeps the work per instance the same on every machine
+    "BranchAndBoundSolver": (lambda: BranchAndBoundSolver(node_limit=2000), 4, 32),
+}
+
+# Largest instance whose optimum is computed (and stored) for the optimality gap
+EXACT_LIMIT = 16
+
+# Beardwood-Halton-Hammersley constant: an optimal tour through n uniform points in
+# area A has length about BHH * sqrt(n * A), which gives a quality measure at any n
+BHH = 0.7124
+
+# Medians below this are left out of the exponent fits, as timer resolution dominates them
+_FIT_FLOOR = 1e-5  # seconds
+
+# Regressions smaller than these are timer or allocator noise
+_TIME_FLOOR = 1e-3  # seconds
+_MEMORY_FLOOR = 64 << 10  # bytes
+_COST_TOLERANCE = 1e-3  # relative
+
+
+def sizes(smallest, largest, factor=2):
+    """Geometric range of instance sizes from smallest up to largest."""
+    result = []
+    n = smallest
+    while n <= largest:
+        result.append(n)
+        n = max(n + 1, int(round(n * factor)))
+    return result
+
+
+def instances(n, count, seed):
+    # Uniform instances on a square that grows with n, so every size keeps the same density
+    side = max(100, math.ceil(10 * math.sqrt(n)))
+    points = unique_points(count, n, (0, side), (0, side), seed=[seed, n])
+    return [EuclideanTSPGraph.from_arrays(p, name=f"bench{n}-{i+1}") for i, p in enumerate(points)], side
+
+
+def fresh(graph):
+    # A copy without the cached distance matrix, neighbor lists or spatial index, so every
+    # run pays for the derived data it uses, as a freshly loaded instance does
+    return EuclideanTSPGraph.from_arrays(graph.coords, graph.node_ids, graph.name)
+
+
+def time_runs(solver, graph, warmups, repeats, seed):
+    # Seconds of each timed analyze() call; only the call is timed, with the garbage collector
+    # paused as in timeit, and stochastic solvers are reseeded so every run does the same work
+    times = []
+    for run in range(warmups + repeats):
+        if hasattr(solver, "reseed"):
+            solver.reseed(seed)
+        graph = fresh(graph)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            route = solver.analyze(graph)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if run >= warmups:
+            times.append(elapsed)
+    return route, times
+
+
+def peak_memory(solver, graph, seed):
+    # Peak bytes traced during one run, kept apart from the timed runs since tracing slows them
+    if hasattr(solver, "reseed"):
+        solver.reseed(seed)
+    graph = fresh(graph)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        solver.analyze(graph)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_solver(name, factory, ns, count=3, warmups=1, repeats=5, seed=0, store=None):
+    """One record per size: timing percentiles over every run on every instance, peak
+    memory, mean tour cost, mean optimality gap (when n <= EXACT_LIMIT) and BHH ratio."""
+    records = []
+    for n in ns:
+        graphs, side = instances(n, count, seed)
+        times, memory, costs, gaps = [], [], [], []
+        for i, graph in enumerate(graphs):
+            solver = factory()
+            route, runs = time_runs(solver, graph, warmups, repeats, seed + i)
+            if not graph.is_valid_tour(route):
+                raise ValueError(f"{name} returned an invalid tour on {graph.name}.")
+            times.extend(runs)
+            memory.append(peak_memory(solver, graph, seed + i))
+            cost = graph.tour_cost(route)
+            costs.append(cost)
+            if store is not None and n <= EXACT_LIMIT:
+                optimal_cost = store.optimal_cost(graph, DynamicProgrammingSolver())
+                gaps.append((cost - optimal_cost) / optimal_cost * 100 if optimal_cost else 0.0)
+
+        p5, p25, p50, p75, p95 = np.percentile(times, [5, 25, 50, 75, 95]).tolist()
+        record = {
+            "solver": name, "n": n, "instances": count, "runs": len(times),
+            "time": {"min": min(times), "mean": float(np.mean(times)), "max": max(times),
+                     "p5": p5, "p25": p25, "p50": p50, "p75": p75, "p95": p95},
+            "peak_memory": max(memory),
+            "cost": float(np.mean(costs)),
+            "gap": float(np.mean(gaps)) if gaps else None,
+            "bhh_ratio": float(np.mean(costs)) / (BHH * math.sqrt(n) * side),
+        }
+        records.append(record)
+        print(f"{name} n={n}: median {p50:.6f}s, p95 {p95:.6f}s, "
+              f"peak {record['peak_memory'] / 1024:.1f} KiB, cost {record['cost']:.1f}")
+    return records
+
+
+def fit_exponent(ns, values, floor=0.0):
+    """Slope of log(values) against log(n): the empirical exponent k of values ~ n^k.
+    Points at or below floor are left out; None when fewer than two remain."""
+    points = [(n, v) for n, v in zip(ns, values) if v > floor]
+    if len(points) < 2:
+        return None
+    x, y = np.log([p[0] for p in points]), np.log([p[1] for p in points])
+    return float(np.polyfit(x, y, 1)[0])
+
+
+def run_benchmark(solvers=None, max_n=None, factor=2, count=3, warmups=1, repeats=5, seed=0, store=None):
+    """Benchmark the named solvers (all of SOLVERS by default) and return the results as a
+    JSON-ready dict: the machine and settings, every record, and each solver's fitted exponents."""
+    store = store or OptimalCostStore()
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(),
+            "factor": factor, "instances": count, "warmups": warmups, "repeats": repeats, "seed": seed,
+        },
+        "records": [],
+        "exponents": {},
+    }
+    for name in solvers or SOLVERS:
+        factory, smallest, largest = SOLVERS[name]
+        ns = sizes(smallest, min(largest, max_n) if max_n else largest, factor)
+        records = benchmark_solver(name, factory, ns, count, warmups, repeats, seed, store)
+        results["records"].extend(records)
+        results["exponents"][name] = {
+            "time": fit_exponent(ns, [r["time"]["p50"] for r in records], _FIT_FLOOR),
+            "memory": fit_exponent(ns, [r["peak_memory"] for r in records]),
+        }
+    return results
+
+
+def compare(results, baseline, threshold=1.25):
+    """Messages for every record that regressed against the baseline: median time or peak
+    memory above threshold times the baseline (beyond the noise floors), or a worse tour cost."""
+    for key in ("factor", "instances", "seed"):
+        if results["meta"][key] != baseline["meta"][key]:
+            raise ValueError(f"Baseline was run with {key}={baseline['meta'][key]}, not {results['meta'][key]}.")
+
+    previous = {(r["solver"], r["n"]): r for r in baseline["records"]}
+    regressions = []
+    for record in results["records"]:
+        old = previous.get((record["solver"], record["n"]))
+        if old is None:
+            continue
+        where = f"{record['solver']} n={record['n']}"
+        time_now, time_then = record["time"]["p50"], old["time"]["p50"]
+        if time_now > threshold * time_then and time_now - time_then > _TIME_FLOOR:
+            regressions.append(f"{where}: median time {time_then:.6f}s -> {time_now:.6f}s")
+        memory_now, memory_then = record["peak_memory"], old["peak_memory"]
+        if memory_now > threshold * memory_then and memory_now - memory_then > _MEMORY_FLOOR:
+            regressions.append(f"{where}: peak memory {memory_then} -> {memory_now} bytes")
+        if record["cost"] > old["cost"] * (1 + _COST_TOLERANCE):
+            regressions.append(f"{where}: mean cost {old['cost']:.1f} -> {record['cost']:.1f}")
+    return regressions
+
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_atomic(path, lambda f: f.write(json.dumps(results, indent=2).encode()))
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the TSP solvers over a geometric range of sizes.")
+    parser.add_argument("--solvers", nargs="+", choices=list(SOLVERS), help="solvers to run (default: all)")
+    parser.add_argument("--max-n", type=int, help="cap on the largest instance size")
+    parser.add_argument("--factor", type=float, default=2, help="ratio between consecutive sizes")
+    parser.add_argument("--instances", type=int, default=3, help="instances per size")
+    parser.add_argument("--warmups", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default: results/benchmark/<timestamp>.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown or memory growth that counts as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.solvers, args.max_n, args.factor, args.instances, args.warmups, args.repeats, args.seed)
+    for name, exponents in results["exponents"].items():
+        time_exponent, memory_exponent = (f"{e:.2f}" if e is not None else "?" for e in exponents.values())
+        print(f"{name}: time ~ n^{time_exponent}, memory ~ n^{memory_exponent}")
+
+    output = args.output or os.path.join(BENCHMARK_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    save_results(results, output)
+    print(f"Saved {output}")
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"Saved baseline {args.baseline}")
+    elif os.path.exists(args.baseline):
+        regressions = compare(results, load_results(args.baseline), args.threshold)
+        for message in regressions:
+            print("REGRESSION " + message)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
@@ -0,0 +1,126 @@
+import itertools
+import random
+
+import numpy as np
+
+from graph import EuclideanTSPGraph
+from heuristic import GreedySolver, NearestNeighborSolver
+from local_search import ArrayTour, TwoLevelList, LocalSearch
+
+# Consistency checks for the tour data structures and search moves, which are easy to get
+# subtly wrong; run with python check.py. Every check raises AssertionError on a failure.
+
+
+def canonical(order):
+    # The cyclic tour order from node 0, in whichever direction has the smaller second node
+    start = order.index(0)
+    order = order[start:] + order[:start]
+    backward = [order[0]] + order[:0:-1]
+    return min(order, backward)
+
+
+def check_flips(n, flips, seed):
+    # Random TwoLevelList.flip calls against reversing the same path of a plain list. A flip may
+    # reverse the complement instead, so after each comparison the list takes the tour's orientation
+    rng = random.Random(seed)
+    order = list(range(n))
+    rng.shuffle(order)
+    tour = TwoLevelList(order)
+    for _ in range(flips):
+        a, b = rng.sample(range(n), 2)
+        i, j = order.index(a), order.index(b)
+        path = [order[(i + k) % n] for k in range((j - i) % n + 1)]
+        for k, node in enumerate(reversed(path)):
+            order[(i + k) % n] = node
+        tour.flip(a, b)
+
+        current = tour.order()
+        assert canonical(current) == canonical(order), f"flip({a}, {b}) on {n} nodes differs from a list reversal"
+        assert all(tour.succ(tour.pred(node)) == node for node in range(n)), "succ and pred disagree"
+        assert all(tour.succ(current[k - 1]) == current[k] for k in range(n)), "succ disagrees with order()"
+        order = current
+
+
+def check_improve(n, seed, tour_type):
+    # improve() returns a valid tour whose cost is the last trajectory entry, after strictly improving moves
+    graph = EuclideanTSPGraph()
+    graph.generate_random(n, x_range=(0, 10 * n), y_range=(0, 10 * n), seed=seed)
+    search = LocalSearch(tour_type=tour_type)
+    route = search.improve(graph, NearestNeighborSolver(graph.node_ids[0]).analyze(graph))
+    costs = [cost for _, cost in search.trajectory]
+    assert graph.is_valid_tour(route), f"{tour_type.__name__} returned an invalid tour"
+    assert graph.tour_cost(route) == costs[-1], f"{tour_type.__name__} cost {graph.tour_cost(route)} != trajectory {costs[-1]}"
+    assert all(later < earlier for earlier, later in zip(costs, costs[1:])), "a move did not improve the tour"
+
+
+def full_sort_greedy(graph):
+    # Reference greedy matching: every edge, shortest first, skipping those that close a cycle early
+    n = graph.dimension
+    matrix = graph.distance_matrix()
+    parent, degree = list(range(n)), [0] * n
+    adj = [[] for _ in range(n)]
+
+    def find(u):
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        return u
+
+    edges = sorted((matrix[i, j], i, j) for i in range(n) for j in range(i + 1, n))
+    for _, i, j in edges:
+        if degree[i] < 2 and degree[j] < 2 and find(i) != find(j):
+            parent[find(i)] = find(j)
+            degree[i] += 1
+            degree[j] += 1
+            adj[i].append(j)
+            adj[j].append(i)
+    ends = [u for u in range(n) if degree[u] < 2]
+    cost = sum(matrix[i, j] for i in range(n) for j in adj[i]) // 2
+    return cost + matrix[ends[0], ends[-1]]
+
+
+def check_greedy(n, seed):
+    # GreedySolver's candidate-list matching against a full edge sort (costs, since ties may pick other edges)
+    graph = EuclideanTSPGraph()
+    graph.generate_random(n, x_range=(0, 1000), y_range=(0, 1000), seed=seed)
+    route = GreedySolver().analyze(graph)
+    assert graph.is_valid_tour(route), "GreedySolver returned an invalid tour"
+    return graph.tour_cost(route) == full_sort_greedy(graph)
+
+
+def check_beam(n, seed):
+    # Beam search as wide as the number of tours from node 0 must find the brute-force optimum
+    import torch
+    from torch_geometric.data import Batch
+    from PtrNetwork import PointerNetGNN, graph_to_data
+    from TSPRLAgent import decode_tours, tour_lengths
+
+    torch.manual_seed(seed)
+    graph = EuclideanTSPGraph()
+    graph.generate_random(n, seed=seed)
+    batch = Batch.from_data_list([graph_to_data(graph)])
+    with torch.inference_mode():
+        tours, _, _, mask = decode_tours(PointerNetGNN().eval(), batch, "beam", beam_width=np.prod(range(1, n)))
+        coords = batch.x.unsqueeze(0)
+        best = tour_lengths(coords, tours, mask).item()
+        every = torch.tensor([(0,) + rest for rest in itertools.permutations(range(1, n))])
+        optimum = tour_lengths(coords.expand(len(every), -1, -1), every, mask.expand(len(every), -1)).min().item()
+    assert abs(best - optimum) < 1e-5, f"beam search found {best}, brute force {optimum}"
+
+
+if __name__ == "__main__":
+    for n, seed in [(5, 0), (40, 1), (300, 2), (1000, 3)]:
+        check_flips(n, 300, seed)
+    print("TwoLevelList flips match list reversals")
+
+    for n, seed in [(20, 0), (200, 1), (1000, 2)]:
+        for tour_type in (ArrayTour, TwoLevelList):
+            check_improve(n, seed, tour_type)
+    print("LocalSearch costs match their trajectories with both tour types")
+
+    matches = sum(check_greedy(n, seed) for n in (10, 50, 200) for seed in range(5))
+    print(f"GreedySolver matches a full edge sort on {matches}/15 instances (the rest differ by ties)")
+
+    for seed in range(3):
+        check_beam(6, seed)
+    print("Beam search matches brute force on 6 nodes")
@@ -0,0 +1,135 @@
+import os
+import re
+
+import numpy as np
+
+from graph import EuclideanTSPGraph, write_atomic
+
+
+def list_instances(data_directory_or_files):
+    """(filename, path) pairs of the .tsp files of a directory (numeric order) or a list of paths."""
+    if isinstance(data_directory_or_files, list):
+        return [(filename, filename) for filename in data_directory_or_files]
+
+    files = [f for f in os.listdir(data_directory_or_files) if f.endswith(".tsp")]
+
+    def extract_numeric_parts(filename):
+        return [int(part) for part in re.findall(r'\d+', filename)]
+
+    files = sorted(files, key=extract_numeric_parts)
+    return [(filename, os.path.join(data_directory_or_files, filename)) for filename in files]
+
+
+class PackedDataset:
+    """Many TSP instances of one size packed into a single .npz file.
+
+    coords is a (num_instances, n, 2) array. names, node_ids ((n,) shared by all
+    instances, or (num_instances, n)), and the optional tours (num_instances, n)
+    and costs (num_instances,) describe the instances. Indexing with an int builds
+    that instance's EuclideanTSPGraph on demand; slicing gives a PackedDataset
+    over views of the same arrays.
+    """
+
+    def __init__(self, coords, names=None, node_ids=None, tours=None, costs=None, edge_weight_type="EUC_2D"):
+        self.coords = np.asarray(coords)
+        if self.coords.ndim != 3 or self.coords.shape[2] != 2:
+            raise ValueError("Expected a (num_instances, n, 2) coordinate array.")
+        num, n = self.coords.shape[:2]
+        self.names = np.asarray([f"instance-{i+1}" for i in range(num)] if names is None else names, dtype=str)
+        self.node_ids = np.arange(n) if node_ids is None else np.asarray(node_ids)
+        self.tours = None if tours is None else np.asarray(tours)
+        self.costs = None if costs is None else np.asarray(costs)
+        self.edge_weight_type = edge_weight_type
+
+        if self.names.shape != (num,):
+            raise ValueError(f"Expected {num} names.")
+        if self.node_ids.shape not in ((n,), (num, n)):
+            raise ValueError(f"Expected node ids of shape ({n},) or ({num}, {n}).")
+        if self.tours is not None and self.tours.shape != (num, n):
+            raise ValueError(f"Expected tours of shape ({num}, {n}).")
+        if self.costs is not None and self.costs.shape != (num,):
+            raise ValueError(f"Expected {num} costs.")
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PackedDataset(self.coords[index], self.names[index],
+                                 self.node_ids if self.node_ids.ndim == 1 else self.node_ids[index],
+                                 None if self.tours is None else self.tours[index],
+                                 None if self.costs is None else self.costs[index],
+                                 self.edge_weight_type)
+        index = range(len(self))[index]  # bounds check and negative indices
+        node_ids = self.node_ids if self.node_ids.ndim == 1 else self.node_ids[index]
+        graph = EuclideanTSPGraph.from_arrays(self.coords[index], node_ids.tolist(), name=str(self.names[index]))
+        graph.edge_weight_type = self.edge_weight_type
+        return graph
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def dimension(self):
+        return self.coords.shape[1]
+
+    def save(self, path):
+        """Write the dataset as an uncompressed .npz; integral coordinates are stored as int32."""
+        coords = self.coords
+        if coords.dtype.kind == "f" and np.array_equal(coords, np.rint(coords)) and np.abs(coords).max(initial=0) < 2 ** 31:
+            coords = coords.astype(np.int32)
+        arrays = {"coords": coords, "names": self.names, "node_ids": self.node_ids,
+                  "edge_weight_type": np.array(self.edge_weight_type)}
+        if self.tours is not None:
+            arrays["tours"] = self.tours
+        if self.costs is not None:
+            arrays["costs"] = self.costs
+        write_atomic(path, lambda f: np.savez(f, **arrays))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["coords"], data["names"], data["node_ids"],
+                       data["tours"] if "tours" in data else None,
+                       data["costs"] if "costs" in data else None,
+                       str(data["edge_weight_type"]))
+
+    @classmethod
+    def from_tsp(cls, data_directory_or_files, store=None):
+        """Pack a directory (or list) of .tsp files of one size; with an OptimalCostStore,
+        its proven optimal costs are packed too (NaN where unknown)."""
+        names, coords, node_ids, costs = [], [], [], []
+        edge_weight_type = None
+        for filename, file_path in list_instances(data_directory_or_files):
+            graph = EuclideanTSPGraph()
+            graph.load_from_file(file_path)
+            if coords and graph.dimension != coords[0].shape[0]:
+                raise ValueError(f"{file_path} has {graph.dimension} nodes, expected {coords[0].shape[0]}.")
+            if edge_weight_type not in (None, graph.edge_weight_type):
+                raise ValueError(f"{file_path} uses {graph.edge_weight_type}, expected {edge_weight_type}.")
+            edge_weight_type = graph.edge_weight_type
+            names.append(os.path.basename(filename).removesuffix(".tsp"))
+            coords.append(graph.coords)
+            node_ids.append(graph.node_ids)
+            if store is not None:
+                known = store.lookup(graph)
+                costs.append(known[0] if known is not None and known[1] else np.nan)
+        if not coords:
+            raise ValueError("No .tsp files to pack.")
+
+        node_ids = np.array(node_ids)
+        if (node_ids == node_ids[0]).all():
+            node_ids = node_ids[0]
+        return cls(np.stack(coords), names, node_ids, costs=np.array(costs) if store is not None else None,
+                   edge_weight_type=edge_weight_type)
+
+    def to_tsp(self, directory):
+        """Write every instance to directory as <name>.tsp and return the paths."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for graph in self:
+            path = os.path.join(directory, graph.name + ".tsp")
+            graph.save_to_file(path)
+            paths.append(path)
+        return paths
@@ -1,37 +1,68 @@
 import os
-import re
+import sys
 import csv
 import time
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 from graph import EuclideanTSPGraph
-from llm_solver import LLMSolver
-from exact import DynamicProgrammingSolver
+from dataset import PackedDataset, list_instances
+from optimal import OptimalCostStore
+from llm_solver import LLMSolver, AsyncLLMSolver
+from response_cache import ResponseCache
+from exact import DynamicProgrammingSolver, BranchAndBoundSolver
 from heuristic import NearestNeighborSolver, GreedySolver, RandomizedSolver
+from rl_solver import GATRLSolver, RL_CHECKPOINT
+from seeds import seed_sequence, seed_label
 
-def variance(llm_solver: LLMSolver, filepath, output_path, num_tests):
+# Parsed .tsp files are cached here so repeated runs skip the text parse
+TSP_CACHE_DIR = ".tspcache"
+
+# Largest instance solved exactly for its optimality gap; the Held-Karp tables grow as n^2 * 2^n,
+# so larger instances get a branch and bound with a budget of BOUND_NODE_LIMIT expanded paths,
+# which proves every tsp30 instance optimal, and otherwise leaves its tour as an upper bound
+EXACT_LIMIT = 20
+BOUND_NODE_LIMIT = 250000
+
+def reference_solver(graph, exact_solver):
+    # exact_solver up to EXACT_LIMIT nodes, a budgeted branch and bound above that
+    if exact_solver is not None and graph.dimension > EXACT_LIMIT:
+        return BranchAndBoundSolver(node_limit=BOUND_NODE_LIMIT)
+    return exact_solver
+
+
+def variance(llm_solver: LLMSolver, filepath, output_path, num_tests, store=None):
     graph = EuclideanTSPGraph()
-    graph.load_from_file(filepath)
+    graph.load_from_file(filepath, cache_dir=TSP_CACHE_DIR)
 
-    esolver = DynamicProgrammingSolver()
-    graph.set_solution(esolver.analyze(graph))
-    optimal_cost = graph.get_solution_cost()
+    store = store or OptimalCostStore()
+    optimal_cost = store.optimal_cost(graph, reference_solver(graph, DynamicProgrammingSolver()))
 
     results = []
 
+    # An AsyncLLMSolver runs all trials concurrently, each timed on its own
+    trials = llm_solver.analyze_many([graph] * num_tests) if hasattr(llm_solver, "analyze_many") else None
+
     for i in range(num_tests):
-        graph.load_from_file(filepath)  # Reload to reset any prior solution
+        graph.load_from_file(filepath, cache_dir=TSP_CACHE_DIR)  # Reload to reset any prior solution
 
-        start_time = time.time()
-        route = llm_solver.analyze(graph)
-        end_time = time.time()
+        if trials is None:
+            start_time = time.time()
+            route = llm_solver.analyze(graph)
+            elapsed_time = time.time() - start_time
+        else:
+            route, elapsed_time = trials[i]
+            if route is None:
+                print("Failed trial " + str(i+1) + " on " + os.path.basename(filepath).removesuffix(".tsp"))
+                continue
 
         if isinstance(route, tuple):
             route = route[0]  # Handle (tour, cost) return style
 
         graph.set_solution(route)
         cost = graph.get_solution_cost()
-        duration = round(end_time - start_time, 5)
+        duration = round(elapsed_time, 5)
         gap = round(((cost - optimal_cost) / optimal_cost) * 100, 5)
 
         results.append([i + 1, round(cost, 5), duration, gap])
@@ -68,168 +99,265 @@ def load_optimal_costs(csv_path):
     return optimal_map
 
 
-def collect_data(solver, data_directory_or_files, output_path, exact_values=None):
-    if isinstance(data_directory_or_files, list):
-        files = data_directory_or_files
-    else:
-        files = [f for f in os.listdir(data_directory_or_files) if f.endswith(".tsp")]
+def import_optimal_costs(store, csv_path, names, instances):
+    # Seeds the store with the costs of a results CSV: proven optima if it holds DynamicProgrammingSolver
+    # results (by its file name, as collect_data writes them), upper bounds otherwise
+    optimal = os.path.basename(csv_path).startswith("DynamicProgrammingSolver")
+    optimal_map = load_optimal_costs(csv_path)
+    for name, instance in zip(names, instances):
+        cost = optimal_map.get(name)
+        if cost is not None:
+            store.record(load_instance(instance), cost, optimal=optimal, solver=os.path.basename(csv_path))
+
+
+def load_instances(data):
+    # (names, instances) of a directory or list of .tsp files (instances are their paths), or of
+    # a PackedDataset or .npz path (instances are the dataset, which builds each graph on demand)
+    if isinstance(data, str) and data.endswith(".npz"):
+        data = PackedDataset.load(data)
+    if isinstance(data, PackedDataset):
+        return data.names.tolist(), data
+    instances = list_instances(data)
+    return [os.path.basename(filename).removesuffix(".tsp") for filename, _ in instances], [path for _, path in instances]
+
+
+def load_instance(instance):
+    # A graph passes through; a .tsp path is loaded through the parse cache
+    if isinstance(instance, EuclideanTSPGraph):
+        return instance
+    graph = EuclideanTSPGraph()
+    graph.load_from_file(instance, cache_dir=TSP_CACHE_DIR)
+    return graph
 
-        def extract_numeric_parts(filename):
-            return [int(part) for part in re.findall(r'\d+', filename)]
 
-        files = sorted(files, key=extract_numeric_parts)
+def spawn_seeds(seed, count):
+    # Independent child seeds of one root seed, as ints that can be written to the results
+    return [int(child.generate_state(1, np.uint64)[0]) for child in seed_sequence(seed).spawn(count)]
 
-    if exact_values:
-        optimal_cost_map = load_optimal_costs(exact_values)
+
+def evaluate_instance(solver, instance, exact_solver=None, clock=time.time, store=None, seed=None):
+    # Loads one instance (a .tsp path or a graph) and times solving it. The reference cost for the optimality gap comes
+    # from the store, solving with exact_solver only when no optimum is stored yet and the instance
+    # has at most EXACT_LIMIT nodes, or with a budgeted BranchAndBoundSolver above that; it is the
+    # best known cost apart from the solver's own tour, so an unproven gap is never to itself. Stochastic
+    # solvers (those with reseed()) are reseeded with seed first; the seed used is returned
+    # last, or None if the solver was not reseeded.
+    # for real time use time.time()
+    # for cpu time use time.process_time()
+    graph = load_instance(instance)
+
+    if seed is not None and hasattr(solver, "reseed"):
+        solver.reseed(seed)
+    else:
+        seed = None
+
+    start_time = clock()
+    route = solver.analyze(graph)
+    end_time = clock()
+
+    return score_instance(solver, graph, route, end_time - start_time, exact_solver, store) + (seed,)
+
+
+def score_instance(solver, graph, route, elapsed_time, exact_solver=None, store=None):
+    # (cost, elapsed_time, reference_cost, is_optimal) of a solved instance, with reference_cost the
+    # optimum or best known bound as in evaluate_instance (None when there is none)
+    graph.set_solution(route)
+    cost = graph.get_solution_cost()
+    optimal = isinstance(solver, DynamicProgrammingSolver)
+    exact_solver = reference_solver(graph, exact_solver)
+
+    if store is not None:
+        if optimal:
+            store.record(graph, cost, optimal=True, solver=type(solver).__name__)
+        store.optimal_cost(graph, exact_solver)
+        reference = store.lookup(graph)
+        if not optimal:
+            store.record(graph, cost, solver=type(solver).__name__)
+    elif exact_solver is not None:
+        reference = graph.tour_cost(exact_solver.analyze(graph)), getattr(exact_solver, "gap", 0) == 0
     else:
-        esolver = DynamicProgrammingSolver()
+        reference = None
+
+    reference_cost, is_optimal = reference or (None, False)
+    return cost, elapsed_time, reference_cost, is_optimal
+
+
+def run_instances(solver, instances, exact_solver=None, workers=None, store=None, seed=None):
+    # Yields evaluate_instance results in instance order. With workers > 1 the instances are
+    # spread over a process pool (solvers must be picklable) and timed with each worker's
+    # CPU time, so the timings are not skewed by contention between workers. Each instance
+    # gets its own child seed of seed, so both ways give the same tours.
+    # Solvers with analyze_many() (the LLM solvers and GATRLSolver) get every instance at once, in
+    # this process whatever workers is: AsyncLLMSolver keeps them in flight together and GATRLSolver
+    # decodes them in batches. Each instance is timed by the solver itself, and a stochastic one is
+    # seeded once, with the first child seed. An instance the solver gave up on yields None.
+    seeds = spawn_seeds(seed, len(instances))
+    if hasattr(solver, "analyze_many"):
+        batch_seed = None
+        if seeds and hasattr(solver, "reseed"):
+            batch_seed = seeds[0]
+            solver.reseed(batch_seed)
+        graphs = [load_instance(instance) for instance in instances]
+        for graph, (route, elapsed_time) in zip(graphs, solver.analyze_many(graphs)):
+            if route is None:
+                yield None
+            else:
+                yield score_instance(solver, graph, route, elapsed_time, exact_solver, store) + (batch_seed,)
+        return
+    if not workers or workers <= 1:
+        for instance, instance_seed in zip(instances, seeds):
+            yield evaluate_instance(solver, instance, exact_solver, store=store, seed=instance_seed)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(evaluate_instance, repeat(solver), instances, repeat(exact_solver),
+                            repeat(time.process_time), repeat(store), seeds)
+
+
+def collect_data(solver, data_directory_or_files, output_path, exact_values=None, workers=None, store=None, seed=None):
+    # seed is the root of the per-instance seeds; a fresh one is drawn if None. Its seed_label() (entropy and
+    # spawn key) goes in the Mean row, and passing that label back as seed replays the run.
+    # data_directory_or_files may also be a PackedDataset or the path of a packed .npz dataset
+    names, instances = load_instances(data_directory_or_files)
+    seed = seed_label(seed)
+
+    store = store or OptimalCostStore()
+    if exact_values:
+        import_optimal_costs(store, exact_values, names, instances)
+    if isinstance(instances, PackedDataset) and instances.costs is not None:
+        for graph, cost in zip(instances, instances.costs.tolist()):
+            if cost == cost:  # NaN marks an unknown optimum
+                store.record(graph, cost, optimal=True, solver="PackedDataset")
+    esolver = DynamicProgrammingSolver()  # only runs for instances without a stored optimum
     #solver = solver_class()
 
     with open(output_path, mode='w', newline='') as file:
         writer = csv.writer(file)
-        writer.writerow(["filename", "cost", "time (s)", "optimality gap (%)"])
+        # reference is "optimal" when the gap is to a proven optimum, "bound" when it is to the best known tour
+        writer.writerow(["filename", "cost", "time (s)", "optimality gap (%)", "seed", "reference"])
         
         total_cost = 0
         total_time = 0
         total_gap = 0
         num_files = 0
-
-        for filename in files:
-            file_path = os.path.join(data_directory_or_files, filename) if not isinstance(data_directory_or_files, list) else filename
-            
-            graph = EuclideanTSPGraph()
-            graph.load_from_file(file_path)
-
-            start_time = time.time()
-            graph.set_solution(solver.analyze(graph))
-            end_time = time.time()
-            # for real time use time.time()
-            # for cpu time use time.process_time()
-
-            elapsed_time = end_time - start_time
-
-            cost = graph.get_solution_cost()
-
-            if exact_values:
-                optimal_cost = optimal_cost_map.get(filename.removesuffix(".tsp"))
-                if optimal_cost is None:
-                    raise ValueError(f"No optimal cost found for {filename}")
+        num_gaps = 0
+        all_optimal = True
+
+        results = run_instances(solver, instances, esolver, workers, store, seed)
+        for name, result in zip(names, results):
+            if result is None:
+                writer.writerow([name, "failed", "-", "-", "-", "-"])
+                print("Failed: " + name)
+                continue
+            cost, elapsed_time, optimal_cost, is_optimal, instance_seed = result
+            if optimal_cost is None:
+                # Nothing to compare with but the tour itself
+                optimality_gap, reference = "-", "-"
             else:
-                if  isinstance(solver, DynamicProgrammingSolver):
-                    optimal_cost = cost
-                else:
-                    graph.set_solution(esolver.analyze(graph))
-                    optimal_cost = graph.get_solution_cost()
-
-            optimality_gap = (cost - optimal_cost) / optimal_cost * 100
+                optimality_gap = (cost - optimal_cost) / optimal_cost * 100
+                reference = "optimal" if is_optimal else "bound"
+                all_optimal = all_optimal and is_optimal
+                total_gap += optimality_gap
+                num_gaps += 1
             
             # Write the row for this file
-            writer.writerow([os.path.basename(filename).removesuffix(".tsp"), cost, f"{elapsed_time:.5f}", optimality_gap])
+            writer.writerow([name, cost, f"{elapsed_time:.5f}", optimality_gap,
+                             "-" if instance_seed is None else instance_seed, reference])
 
             total_cost += cost
             total_time += elapsed_time
-            total_gap += optimality_gap if optimality_gap is not None else 0
             num_files += 1
 
-            print("Evaluated: " + str([os.path.basename(filename).removesuffix(".tsp"), cost, f"{elapsed_time:.5f}", optimality_gap]))
+            print("Evaluated: " + str([name, cost, f"{elapsed_time:.5f}", optimality_gap]))
 
-        mean_cost = total_cost / num_files
-        mean_time = total_time / num_files
-        mean_gap = total_gap / num_files if num_files > 0 else 0
+        mean_cost = total_cost / max(num_files, 1)
+        mean_time = total_time / max(num_files, 1)
+        mean_gap = total_gap / num_gaps if num_gaps > 0 else "-"
         
         # Write the mean values at the end
-        writer.writerow(["Mean", mean_cost, f"{mean_time:.5f}", mean_gap])
-
-
-def collect_data_no_opt(solver, data_directory_or_files, output_path):
-    if isinstance(data_directory_or_files, list):
-        files = data_directory_or_files
-    else:
-        files = [f for f in os.listdir(data_directory_or_files) if f.endswith(".tsp")]
+        writer.writerow(["Mean", mean_cost, f"{mean_time:.5f}", mean_gap, seed,
+                         "-" if num_gaps == 0 else "optimal" if all_optimal else "bound"])
 
-        def extract_numeric_parts(filename):
-            return [int(part) for part in re.findall(r'\d+', filename)]
-
-        files = sorted(files, key=extract_numeric_parts)
 
+def collect_data_no_opt(solver, data_directory_or_files, output_path, workers=None, seed=None, store=None):
+    # No gaps are computed, but every tour is recorded in the store as an upper bound for later runs
+    names, instances = load_instances(data_directory_or_files)
+    seed = seed_label(seed)
+    store = store or OptimalCostStore()
 
     with open(output_path, mode='w', newline='') as file:
         writer = csv.writer(file)
-        writer.writerow(["filename", "cost", "time (s)", "optimality gap (%)"])
+        writer.writerow(["filename", "cost", "time (s)", "optimality gap (%)", "seed"])
         
         total_cost = 0
         total_time = 0
         num_files = 0
 
-        for filename in files:
-            file_path = os.path.join(data_directory_or_files, filename) if not isinstance(data_directory_or_files, list) else filename
-            
-            graph = EuclideanTSPGraph()
-            graph.load_from_file(file_path)
-
-            start_time = time.time()
-            graph.set_solution(solver.analyze(graph))
-            end_time = time.time()
-            # for real time use time.time()
-            # for cpu time use time.process_time()
-
-            elapsed_time = end_time - start_time
-
-            cost = graph.get_solution_cost()
-
-            
+        results = run_instances(solver, instances, workers=workers, store=store, seed=seed)
+        for name, result in zip(names, results):
+            if result is None:
+                writer.writerow([name, "failed", "-", "-", "-"])
+                print("Failed: " + name)
+                continue
+            cost, elapsed_time, _, _, instance_seed = result
             # Write the row for this file
-            writer.writerow([os.path.basename(filename).removesuffix(".tsp"), cost, f"{elapsed_time:.5f}", "-"])
+            writer.writerow([name, cost, f"{elapsed_time:.5f}", "-",
+                             "-" if instance_seed is None else instance_seed])
 
             total_cost += cost
             total_time += elapsed_time
             num_files += 1
 
-            print("Evaluated: " + str([os.path.basename(filename).removesuffix(".tsp"), cost, f"{elapsed_time:.5f}", "-"]))
+            print("Evaluated: " + str([name, cost, f"{elapsed_time:.5f}", "-"]))
 
-        mean_cost = total_cost / num_files
-        mean_time = total_time / num_files
+        mean_cost = total_cost / max(num_files, 1)
+        mean_time = total_time / max(num_files, 1)
         
         # Write the mean values at the end
-        writer.writerow(["Mean", mean_cost, f"{mean_time:.5f}", "-"])
+        writer.writerow(["Mean", mean_cost, f"{mean_time:.5f}", "-", seed])
 
 if __name__ == "__main__":
     esolver = DynamicProgrammingSolver()
     nearest = NearestNeighborSolver(0)
     greedy = GreedySolver(0)
     randomized = RandomizedSolver(0)
-    llm = LLMSolver("gpt-4o")
+    # All 50 instances of a size in flight at once; answers are cached, and --replay reruns from the cache only
+    llm = AsyncLLMSolver("gpt-4o", concurrency=50, cache=ResponseCache(), replay="--replay" in sys.argv)
+    rl = GATRLSolver(RL_CHECKPOINT) if os.path.exists(RL_CHECKPOINT) else None  # train with testRL.py
+    workers = os.cpu_count()  # the LLM solver overlaps its requests in-process instead
 
     for filepath in ["tsp5/tsp5-4.tsp", "tsp10/tsp10-39.tsp", "tsp10/tsp10-43.tsp", "tsp20/tsp20-10.tsp", "tsp20/tsp20-27.tsp"]:
         variance(llm, filepath, "results/variance/LLMSolver-variance-"+os.path.basename(filepath).removesuffix(".tsp")+".csv", 10)
         
     for i in [5, 10, 20]:
         # DynamicProgrammingSolver
-        collect_data(esolver, "tsp"+str(i), "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv")
+        collect_data(esolver, "tsp"+str(i), "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv", workers=workers)
 
         # NearestNeighborSolver
-        collect_data(nearest, "tsp"+str(i), "results/tsp"+str(i)+"/NearestNeighborSolver-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv")
+        collect_data(nearest, "tsp"+str(i), "results/tsp"+str(i)+"/NearestNeighborSolver-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv", workers=workers)
 
         # GreedySolver
-        collect_data(greedy, "tsp"+str(i), "results/tsp"+str(i)+"/GreedySolver-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv")
+        collect_data(greedy, "tsp"+str(i), "results/tsp"+str(i)+"/GreedySolver-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv", workers=workers)
 
         # RandomizedSolver
-        collect_data(randomized, "tsp"+str(i), "results/tsp"+str(i)+"/RandomizedSolver-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv")
+        collect_data(randomized, "tsp"+str(i), "results/tsp"+str(i)+"/RandomizedSolver-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv", workers=workers)
 
         # LLMSolver
         collect_data(llm, "tsp"+str(i), "results/tsp"+str(i)+"/LLMSolver-gpt-4o-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv")
 
-        # RL
+        # GATRLSolver (decodes every instance in-process, in batches)
+        if rl is not None:
+            collect_data(rl, "tsp"+str(i), "results/tsp"+str(i)+"/GATRLSolver-tsp"+str(i)+".csv", "results/tsp"+str(i)+"/DynamicProgrammingSolver-tsp"+str(i)+".csv")
 
     for i in [30]:
         # NearestNeighborSolver
-        collect_data_no_opt(nearest, "tsp"+str(i), "results/tsp"+str(i)+"/NearestNeighborSolver-tsp"+str(i)+".csv")
+        collect_data_no_opt(nearest, "tsp"+str(i), "results/tsp"+str(i)+"/NearestNeighborSolver-tsp"+str(i)+".csv", workers=workers)
 
         # GreedySolver
-        collect_data_no_opt(greedy, "tsp"+str(i), "results/tsp"+str(i)+"/GreedySolver-tsp"+str(i)+".csv")
+        collect_data_no_opt(greedy, "tsp"+str(i), "results/tsp"+str(i)+"/GreedySolver-tsp"+str(i)+".csv", workers=workers)
 
         # RandomizedSolver
-        collect_data_no_opt(randomized, "tsp"+str(i), "results/tsp"+str(i)+"/RandomizedSolver-tsp"+str(i)+".csv")
+        collect_data_no_opt(randomized, "tsp"+str(i), "results/tsp"+str(i)+"/RandomizedSolver-tsp"+str(i)+".csv", workers=workers)
 
         # LLMSolver
         collect_data_no_opt(llm, "tsp"+str(i), "results/tsp"+str(i)+"/LLMSolver-gpt-4o-tsp"+str(i)+".csv")
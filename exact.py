@@ -1,24 +1,255 @@
-from python_tsp.exact import solve_tsp_dynamic_programming, solve_tsp_branch_and_bound
+import time
 import numpy as np
 
+from heuristic import GreedySolver, NearestNeighborSolver
+
+# Rows of a DP layer processed at once, which bounds the size of the temporaries
+_DP_BLOCK = 1 << 16
+
+
+def _popcounts(bits):
+    # Number of set bits of every mask below 2**bits
+    counts = np.zeros(1 << bits, dtype=np.uint8)
+    for b in range(bits):
+        counts[1 << b:2 << b] = counts[:1 << b] + 1
+    return counts
+
+
+def _members(masks, size, bits):
+    # (len(masks), size) array of the set bit positions of each mask, in increasing order
+    members = np.empty((len(masks), size), dtype=np.uint8)
+    shifts = np.arange(bits, dtype=np.int64)
+    for start in range(0, len(masks), _DP_BLOCK):
+        block = (masks[start:start + _DP_BLOCK, None] >> shifts) & 1
+        members[start:start + _DP_BLOCK] = np.nonzero(block)[1].reshape(-1, size)
+    return members
+
+
+def held_karp(distance_matrix):
+    """Exact Held-Karp DP over subset bitmasks, one vectorized layer per subset size.
+
+    Node 0 is the fixed start and bit b of a mask stands for node b + 1. Only the
+    current and previous layer of costs are kept, plus one uint8 parent position
+    per (subset, last node) state for rebuilding the tour.
+    Returns (tour as row indices, cost, peak bytes held by the DP tables).
+    """
+    dist = np.asarray(distance_matrix)
+    n = len(dist)
+    if n <= 3:
+        tour = list(range(n))
+        return tour, int(sum(dist[a, b] for a, b in zip(tour, tour[1:] + tour[:1]))), 0
+
+    m = n - 1
+    dtype = np.int32 if int(dist.max()) * n < 2**31 else np.int64
+    start_leg = dist[0, 1:].astype(dtype)
+    legs = dist[1:, 1:].astype(dtype)
+
+    popcount = _popcounts(m)
+    rank = np.zeros(1 << m, dtype=np.int32)  # position of each mask within its layer
+    static_bytes = popcount.nbytes + rank.nbytes
+
+    masks = np.int64(1) << np.arange(m, dtype=np.int64)
+    rank[masks] = np.arange(m)
+    members = np.arange(m, dtype=np.uint8)[:, None]
+    cost = start_leg[:, None].copy()
+    parents = [None, None]  # parents[k][row, p]: position in the size k-1 subset it came from
+    parent_bytes = 0
+    peak = static_bytes + cost.nbytes + members.nbytes
+
+    for size in range(2, m + 1):
+        layer_masks = np.flatnonzero(popcount == size)
+        count = len(layer_masks)
+        rank[layer_masks] = np.arange(count)
+        layer_members = _members(layer_masks, size, m)
+        layer_cost = np.empty((count, size), dtype=dtype)
+        layer_parent = np.empty((count, size), dtype=np.uint8)
+
+        for p in range(size):
+            for start in range(0, count, _DP_BLOCK):
+                block = slice(start, start + _DP_BLOCK)
+                block_members = layer_members[block]
+                last = block_members[:, p]
+                rows = rank[layer_masks[block] ^ (np.int64(1) << last)]
+                before = np.delete(block_members, p, axis=1)
+                candidates = cost[rows] + legs[before, last[:, None]]
+                best = candidates.argmin(axis=1)
+                layer_parent[block, p] = best
+                layer_cost[block, p] = candidates[np.arange(len(best)), best]
+
+        temp_bytes = 3 * min(count, _DP_BLOCK) * size * 8
+        parent_bytes += layer_parent.nbytes
+        peak = max(peak, static_bytes + parent_bytes + cost.nbytes + members.nbytes
+                   + layer_cost.nbytes + layer_members.nbytes + temp_bytes)
+        parents.append(layer_parent)
+        cost, members = layer_cost, layer_members
+
+    # Close the cycle back to node 0, then follow the parent positions down the layers
+    totals = cost[0] + dist[1:, 0][members[0]].astype(dtype)
+    position = int(totals.argmin())
+    mask = (1 << m) - 1
+    path = []
+    for size in range(m, 0, -1):
+        bits = [b for b in range(m) if mask >> b & 1]
+        node = bits[position]
+        path.append(node + 1)
+        if size > 1:
+            position = int(parents[size][rank[mask], position])
+            mask ^= 1 << node
+
+    return [0] + path[::-1], int(totals.min()), peak
+
+
 class DynamicProgrammingSolver:
     def __init__(self):
-        pass
+        self.peak_memory = None  # bytes held by the DP tables in the last analyze()
 
     def analyze(self, graph):
-        distance_matrix = np.array(graph.to_distance_matrix())
-        
-        solution, cost = solve_tsp_dynamic_programming(distance_matrix)
+        solution, cost, self.peak_memory = held_karp(graph.distance_matrix())
         
-        return solution
+        return [graph.node_ids[i] for i in solution]
     
+def _spanning_tree(weights):
+    # Prim's MST on a dense weight matrix: (total weight, degree of every node)
+    n = len(weights)
+    degree = np.zeros(n, dtype=np.int64)
+    if n < 2:
+        return 0.0, degree
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[0] = True
+    best = weights[0].copy()
+    best[0] = np.inf
+    link = np.zeros(n, dtype=np.intp)
+    total = 0.0
+    for _ in range(n - 1):
+        v = int(best.argmin())
+        total += best[v]
+        degree[v] += 1
+        degree[link[v]] += 1
+        in_tree[v] = True
+        best[v] = np.inf
+        closer = (weights[v] < best) & ~in_tree
+        best[closer] = weights[v][closer]
+        link[closer] = v
+    return total, degree
+
+
+def one_tree_bound(distance_matrix, upper_bound, iterations=None):
+    """Held-Karp lower bound: 1-trees rooted at node 0 under subgradient-optimized node penalties.
+
+    Returns (lower bound, penalties). Stops early once the 1-tree is a tour or the
+    bound shows upper_bound (an integer tour cost) is optimal.
+    """
+    dist = np.asarray(distance_matrix, dtype=float)
+    n = len(dist)
+    penalty = np.zeros(n)
+    best, best_penalty = -np.inf, penalty
+    iterations = iterations or max(100, 10 * n)
+    step, stall = 2.0, 0
+
+    for _ in range(iterations):
+        weights = dist + penalty[:, None] + penalty[None, :]
+        tree, tree_degree = _spanning_tree(weights[1:, 1:])
+        closest = np.argpartition(weights[0, 1:], 1)[:2]
+        value = tree + weights[0, 1:][closest].sum() - 2 * penalty.sum()
+
+        if value > best + 1e-9:
+            best, best_penalty, stall = value, penalty.copy(), 0
+        else:
+            stall += 1
+            if stall >= max(5, n // 4):
+                step, stall = step / 2, 0
+
+        degree = np.zeros(n)
+        degree[0] = 2
+        degree[1:] = tree_degree
+        degree[1 + closest] += 1
+        subgradient = degree - 2
+        if not subgradient.any() or best > upper_bound - 1 + 1e-6 or step < 1e-4:
+            break
+        penalty = penalty + step * (upper_bound - value) / (subgradient @ subgradient) * subgradient
+
+    return best, best_penalty
+
+
+def branch_and_bound(distance_matrix, initial_tour, time_limit=None, node_limit=None):
+    """Depth-first branch and bound over tours starting at node 0.
+
+    Each open path is bounded by its cost plus a spanning tree of the unvisited
+    nodes and the cheapest links back to both path ends, all under the root's
+    Held-Karp penalties. Stops after time_limit seconds or node_limit expanded
+    paths, if given. Returns (tour, cost, proven lower bound, expanded paths).
+    """
+    started = time.perf_counter()
+    dist = np.asarray(distance_matrix)
+    n = len(dist)
+    tour = list(initial_tour)
+    upper = int(sum(dist[a, b] for a, b in zip(tour, tour[1:] + tour[:1])))
+    if n <= 3:
+        return tour, upper, upper, 0
+
+    root_bound, penalty = one_tree_bound(dist, upper)
+    weights = dist + penalty[:, None] + penalty[None, :]
+    np.fill_diagonal(weights, np.inf)
+
+    def bound(path, cost):
+        remaining = np.ones(n, dtype=bool)
+        remaining[list(path)] = False
+        rest = np.flatnonzero(remaining)
+        if len(rest) == 0:
+            return cost + dist[path[-1], 0]
+        tree, _ = _spanning_tree(weights[np.ix_(rest, rest)])
+        links = weights[path[-1], rest].min() + weights[0, rest].min()
+        return cost + tree + links - 2 * penalty[rest].sum() - penalty[path[-1]] - penalty[0]
+
+    # Open paths carry their parent's bound, which also bounds every tour below them
+    stack = [(root_bound, 0, (0,))]
+    expanded = 0
+    while stack:
+        if node_limit is not None and expanded >= node_limit:
+            break
+        if time_limit is not None and time.perf_counter() - started >= time_limit:
+            break
+        _, cost, path = stack.pop()
+        if cost > upper - 1 + 1e-6:
+            continue
+        value = bound(path, cost)
+        expanded += 1
+        if value > upper - 1 + 1e-6:
+            continue
+        if len(path) == n:
+            upper, tour = int(value), list(path)
+            continue
+
+        last = path[-1]
+        visited = set(path)
+        children = [node for node in np.argsort(dist[last])[::-1].tolist() if node not in visited]
+        stack.extend((value, cost + int(dist[last, node]), path + (node,)) for node in children)
+
+    open_bound = min((entry[0] for entry in stack), default=np.inf)
+    lower = min(upper, max(root_bound, open_bound))
+    return tour, upper, int(np.ceil(lower - 1e-6)), expanded
+
+
 class BranchAndBoundSolver:
-    def __init__(self):
-        pass
+    def __init__(self, time_limit=None, node_limit=None, initial_solvers=None):
+        self.time_limit = time_limit  # seconds
+        self.node_limit = node_limit  # expanded search paths
+        self.initial_solvers = initial_solvers  # defaults to greedy and nearest neighbor from the first node
+        self.cost = None
+        self.lower_bound = None
+        self.gap = None  # proven optimality gap (%) of the last tour, 0 when it is optimal
+        self.nodes_explored = 0
 
     def analyze(self, graph):
-        distance_matrix = np.array(graph.to_distance_matrix())
+        distance_matrix = graph.distance_matrix()
+        solvers = self.initial_solvers or [GreedySolver(graph.node_ids[0]), NearestNeighborSolver(graph.node_ids[0])]
+        initial_tour = min((solver.analyze(graph) for solver in solvers), key=graph.tour_cost)
+        initial_tour = graph.to_indices(initial_tour).tolist()
+        start = initial_tour.index(0)
+        initial_tour = initial_tour[start:] + initial_tour[:start]
 
-        solution, cost = solve_tsp_branch_and_bound(distance_matrix)
+        solution, self.cost, self.lower_bound, self.nodes_explored = branch_and_bound(
+            distance_matrix, initial_tour, self.time_limit, self.node_limit)
+        self.gap = (self.cost - self.lower_bound) / self.lower_bound * 100 if self.lower_bound else 0.0
 
-        return solution
\ No newline at end of file
+        return [graph.node_ids[i] for i in solution]
\ No newline at end of file
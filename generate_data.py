@@ -1,25 +1,50 @@
-from graph import EuclideanTSPGraph
+from graph import EuclideanTSPGraph, unique_points
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import os
 
+# Largest number of points sampled at once; bigger datasets are generated in batches
+_BATCH_POINTS = 1 << 22
+
+
+def _write_instance(filepath, name, points):
+    graph = EuclideanTSPGraph.from_arrays(points, name=name)
+    graph.save_to_file(filepath)
+
+
 # directory to place dataset, basic name of tsp instances, number of nodes per instance, number of instances to generate, force generation
-def generate_dataset(dir, base_name, nodes, num, force=False):
+# distribution is a key of graph.POINT_DISTRIBUTIONS; with workers > 1 the files are written by a process pool
+def generate_dataset(dir, base_name, nodes, num, force=False, distribution="uniform", seed=None, workers=None,
+                     x_range=(0, 100), y_range=(0, 100)):
     os.makedirs(dir, exist_ok=True)
-    temp = EuclideanTSPGraph()
+    rng = np.random.default_rng(seed)
+    batch = max(1, _BATCH_POINTS // max(nodes, 1))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
 
-    for i in range(num):
-        name = base_name + str(i+1)
-        filepath = dir + "/" + name + ".tsp"
+    try:
+        for first in range(0, num, batch):
+            # Instances that already exist are still sampled, so skipping them does not change the others
+            points = unique_points(min(batch, num - first), nodes, x_range, y_range, distribution, rng)
+            jobs = []
+            for i, instance in enumerate(points, start=first):
+                name = base_name + str(i+1)
+                filepath = dir + "/" + name + ".tsp"
 
-        if not force and os.path.exists(filepath):
-            print(f"File {filepath} already exists. Skipping generation.")
-            continue
+                if not force and os.path.exists(filepath):
+                    print(f"File {filepath} already exists. Skipping generation.")
+                    continue
+                jobs.append((filepath, name, instance))
 
-        temp.name = name
-        temp.generate_random(nodes)
-        temp.save_to_file(filepath)
+            if pool is None:
+                for job in jobs:
+                    _write_instance(*job)
+            elif jobs:
+                list(pool.map(_write_instance, *zip(*jobs), chunksize=64))
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
 
 if __name__ == "__main__":
     for i in [5, 10, 20, 30]:
-        generate_dataset("tsp"+str(i), "tsp"+str(i)+"-", i, 50)
-
+        generate_dataset("tsp"+str(i), "tsp"+str(i)+"-", i, 50, workers=os.cpu_count())
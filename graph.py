@@ -1,43 +1,300 @@
-import random
 import math
+import os
+import io
+import re
+import json
+import mmap
+import hashlib
+import tempfile
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+from spatial import GridIndex
+
+# Upper bound on the number of pairwise entries computed at once when building
+# the distance matrix, so the float temporaries stay small on large instances.
+_BLOCK_ELEMENTS = 1 << 22
+
+# Section keywords count only at the start of a line, so a COMMENT may mention them
+_NODE_COORD_SECTION = re.compile(rb"^[ \t]*NODE_COORD_SECTION", re.M)
+_EOF = re.compile(rb"^[ \t]*EOF", re.M)
+
+# Largest graph whose nodes are labelled with their ids by default when drawn
+_LABEL_LIMIT = 100
+
+
+def euc_2d(dx, dy):
+    # TSPLIB EUC_2D: Euclidean distance rounded to the nearest integer
+    return np.rint(np.hypot(dx, dy))
+
+
+def ceil_2d(dx, dy):
+    # TSPLIB CEIL_2D: Euclidean distance rounded up
+    return np.ceil(np.hypot(dx, dy))
+
+
+def att(dx, dy):
+    # TSPLIB ATT: pseudo-Euclidean distance, rounded up when rounding went down
+    r = np.sqrt((dx * dx + dy * dy) / 10.0)
+    t = np.rint(r)
+    return np.where(t < r, t + 1, t)
+
+
+EDGE_WEIGHT_FUNCTIONS = {"EUC_2D": euc_2d, "CEIL_2D": ceil_2d, "ATT": att}
+
+
+def write_atomic(path, write):
+    # Write through a temporary file so concurrent readers never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class UniformPoints:
+    """Integer points drawn uniformly from the grid x_range x y_range (inclusive)."""
+
+    def __init__(self, rng, num, n, x_range, y_range):
+        self.rng, self.x_range, self.y_range = rng, x_range, y_range
+
+    def sample(self, rows):
+        # One point for each entry of rows (the instance it belongs to)
+        x = self.rng.integers(self.x_range[0], self.x_range[1], size=len(rows), endpoint=True)
+        y = self.rng.integers(self.y_range[0], self.y_range[1], size=len(rows), endpoint=True)
+        return np.column_stack((x, y))
+
+
+class ClusteredPoints(UniformPoints):
+    """Normally distributed points around n / 10 uniform centers per instance, with a
+    standard deviation of width / sqrt(n) (the DIMACS challenge clustered instances)."""
+
+    def __init__(self, rng, num, n, x_range, y_range):
+        super().__init__(rng, num, n, x_range, y_range)
+        self.centers = super().sample(np.zeros(num * max(1, n // 10))).reshape(num, -1, 2)
+        self.spread = np.array([x_range[1] - x_range[0], y_range[1] - y_range[0]]) / math.sqrt(max(n, 1))
+
+    def sample(self, rows):
+        clusters = self.rng.integers(self.centers.shape[1], size=len(rows))
+        points = self.centers[rows, clusters] + self.rng.normal(size=(len(rows), 2)) * self.spread
+        low, high = (self.x_range[0], self.y_range[0]), (self.x_range[1], self.y_range[1])
+        return np.clip(np.rint(points), low, high).astype(np.int64)
+
+
+POINT_DISTRIBUTIONS = {"uniform": UniformPoints, "clustered": ClusteredPoints}
+
+# Redraw rounds before the remaining duplicate points are placed on free cells directly
+_REFILL_ROUNDS = 8
+# Largest grid whose free cells are enumerated for that direct placement
+_FREE_CELLS_LIMIT = 1 << 24
+
+
+def unique_points(num, n, x_range=(0, 100), y_range=(0, 100), distribution="uniform", seed=None):
+    """(num, n, 2) integer points from one of POINT_DISTRIBUTIONS, distinct within each instance."""
+    rng = np.random.default_rng(seed)
+    height = y_range[1] - y_range[0] + 1
+    cells = (x_range[1] - x_range[0] + 1) * height
+    if n > cells:
+        raise ValueError(f"Cannot place {n} distinct points on a grid of {cells} cells.")
+    sampler = POINT_DISTRIBUTIONS[distribution](rng, num, n, x_range, y_range)
+    points = sampler.sample(np.repeat(np.arange(num), n)).reshape(num, n, 2)
+
+    def repeated():
+        # Every later copy of a point within its instance
+        codes = (points[..., 0] - x_range[0]) * height + (points[..., 1] - y_range[0])
+        order = np.argsort(codes, axis=1, kind="stable")
+        rows, columns = np.nonzero(np.diff(np.take_along_axis(codes, order, axis=1), axis=1) == 0)
+        mask = np.zeros(codes.shape, dtype=bool)
+        mask[rows, order[rows, columns + 1]] = True
+        return mask, codes
+
+    rounds = 0
+    mask, codes = repeated()
+    while mask.any():
+        if rounds < _REFILL_ROUNDS or cells > _FREE_CELLS_LIMIT:
+            points[mask] = sampler.sample(np.nonzero(mask)[0])
+        else:
+            for row in np.flatnonzero(mask.any(axis=1)):
+                free = np.setdiff1d(np.arange(cells), codes[row, ~mask[row]])
+                chosen = rng.choice(free, int(mask[row].sum()), replace=False)
+                points[row, mask[row]] = np.column_stack(np.divmod(chosen, height)) + (x_range[0], y_range[0])
+        rounds += 1
+        mask, codes = repeated()
+    return points
+
 
 class EuclideanTSPGraph:
     def __init__(self, name="tsp graph"):
         self.name = name
-        self.nodes = {}  # node_id: (x, y)
+        self.node_ids = []  # index -> node_id
+        self.node_index = {}  # node_id -> index
+        self._coords = np.empty((16, 2))  # row i holds (x, y) of node_ids[i]
+        self._cache = {}  # derived data, cleared whenever the nodes change
+        self._coord_index = {}  # (x, y) -> node_id, None until rebuilt after a bulk load
         self.dimension = 0
-        self.edge_weight_type = "EUC_2D"
+        self._edge_weight_type = "EUC_2D"
         self.solution = []
         self.solution_cost = None
 
+    @classmethod
+    def from_arrays(cls, coords, node_ids=None, name="tsp graph"):
+        """Build a graph from a (n, 2) coordinate array in one bulk pass."""
+        graph = cls(name)
+        graph.add_nodes(coords, node_ids)
+        return graph
+
+    @property
+    def coords(self):
+        """Read-only (dimension, 2) array of node coordinates in index order."""
+        view = self._coords[:self.dimension]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def edge_weight_type(self):
+        return self._edge_weight_type
+
+    @edge_weight_type.setter
+    def edge_weight_type(self, weight_type):
+        if weight_type not in EDGE_WEIGHT_FUNCTIONS:
+            raise ValueError(f"Unsupported EDGE_WEIGHT_TYPE: expected one of "
+                             f"{', '.join(EDGE_WEIGHT_FUNCTIONS)}, got {weight_type}")
+        self._edge_weight_type = weight_type
+        self._invalidate()
+
+    def _weight(self, dx, dy):
+        return EDGE_WEIGHT_FUNCTIONS[self._edge_weight_type](dx, dy)
+
+    @property
+    def nodes(self):
+        """Read-only mapping node_id -> (x, y)."""
+        nodes = self._cache.get("nodes")
+        if nodes is None:
+            nodes = MappingProxyType(dict(zip(self.node_ids, map(tuple, self.coords.tolist()))))
+            self._cache["nodes"] = nodes
+        return nodes
+
+    def fingerprint(self):
+        """Hash of the edge weight type and sorted coordinates, independent of node ids and order."""
+        key = self._cache.get("fingerprint")
+        if key is None:
+            coords = self.coords
+            ordered = coords[np.lexsort((coords[:, 1], coords[:, 0]))]
+            digest = hashlib.sha1(self._edge_weight_type.encode())
+            digest.update(np.ascontiguousarray(ordered, dtype="<f8").tobytes())
+            key = self._cache["fingerprint"] = digest.hexdigest()
+        return key
+
+    def labelled_fingerprint(self):
+        """Hash of the edge weight type, the coordinates in row order and the node ids, for data
+        that refers to nodes by row or by id (equal only for identically labelled graphs)."""
+        key = self._cache.get("labelled_fingerprint")
+        if key is None:
+            digest = hashlib.sha1(self._edge_weight_type.encode())
+            digest.update(np.ascontiguousarray(self.coords, dtype="<f8").tobytes())
+            digest.update(repr(list(self.node_ids)).encode())
+            key = self._cache["labelled_fingerprint"] = digest.hexdigest()
+        return key
+
+    def _invalidate(self):
+        self._cache.clear()
+
+    def __getstate__(self):
+        # Derived data is rebuilt on demand, so process pool workers are not sent the cache
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        return state
+
+    def _clear_nodes(self):
+        self.node_ids = []
+        self.node_index = {}
+        self._coord_index = {}
+        self.dimension = 0
+        self._invalidate()
+
+    def _reserve(self, size):
+        if size > len(self._coords):
+            grown = np.empty((max(size, 2 * len(self._coords)), 2))
+            grown[:self.dimension] = self._coords[:self.dimension]
+            self._coords = grown
+
     def add_node(self, node_id, x, y):
+        if self._coord_index is None:
+            self._coord_index = dict(zip(map(tuple, self.coords.tolist()), self.node_ids))
+
         # Check if the coordinate already exists
-        for node in self.nodes.values():
-            if node == (x, y):
-                raise ValueError(f"Node with coordinates ({x}, {y}) already exists.")
-        self.nodes[node_id] = (x, y)
-        self.dimension = len(self.nodes)
-
-    def generate_random(self, num_nodes, x_range=(0, 100), y_range=(0, 100)):
-        self.nodes = {}
-        attempts = 0
-        while len(self.nodes) < num_nodes and attempts < 1000:
-            node_id = len(self.nodes)
-            x = random.randint(*x_range)
-            y = random.randint(*y_range)
-            try:
-                self.add_node(node_id, x, y)
-            except ValueError:  # Skip duplicate nodes
-                attempts += 1
-                continue
-        if len(self.nodes) != num_nodes:
-            raise ValueError("Failed to generate a complete set of unique nodes after 1000 attempts.")
+        key = (float(x), float(y))
+        if key in self._coord_index:
+            raise ValueError(f"Node with coordinates ({x}, {y}) already exists.")
+
+        index = self.node_index.get(node_id)
+        if index is None:
+            index = self.dimension
+            self._reserve(index + 1)
+            self.node_ids.append(node_id)
+            self.node_index[node_id] = index
+            self.dimension = len(self.node_ids)
+        else:
+            del self._coord_index[tuple(self._coords[index].tolist())]
+        self._coords[index] = key
+        self._coord_index[key] = node_id
+        self._invalidate()
+
+    def add_nodes(self, coords, node_ids=None):
+        """Add many nodes at once; node_ids defaults to consecutive ids after the largest current id."""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        count = len(coords)
+        if node_ids is None:
+            first = max(self.node_ids) + 1 if self.node_ids else 0
+            node_ids = range(first, first + count)
+        node_ids = list(node_ids)
+        if len(node_ids) != count:
+            raise ValueError(f"Got {len(node_ids)} node ids for {count} coordinates.")
+        if len(set(node_ids)) != count or (self.to_indices(node_ids) >= 0).any():
+            raise ValueError("Node ids must be unique and not already in the graph.")
+
+        # Duplicate coordinates show up as equal neighbours after a lexicographic sort
+        combined = np.concatenate((self.coords, coords))
+        order = np.lexsort((combined[:, 1], combined[:, 0]))
+        ordered = combined[order]
+        repeated = np.flatnonzero((ordered[1:] == ordered[:-1]).all(axis=1))
+        if len(repeated):
+            x, y = ordered[repeated[0]]
+            raise ValueError(f"Node with coordinates ({x}, {y}) already exists.")
+
+        start = self.dimension
+        self._reserve(start + count)
+        self._coords[start:start + count] = coords
+        self.node_index.update(zip(node_ids, range(start, start + count)))
+        self.node_ids.extend(node_ids)
+        self.dimension = len(self.node_ids)
+        self._coord_index = None
+        self._invalidate()
+
+    def generate_random(self, num_nodes, x_range=(0, 100), y_range=(0, 100), seed=None, distribution="uniform"):
+        # seed: int, SeedSequence or numpy Generator; the ranges are inclusive
+        points = unique_points(1, num_nodes, x_range, y_range, distribution, seed)[0]
+        self._clear_nodes()
+        self.add_nodes(points)
 
     def distance(self, node1, node2):
-        x1, y1 = self.nodes[node1]
-        x2, y2 = self.nodes[node2]
-        return int(round(math.hypot(x1 - x2, y1 - y2)))
+        i, j = self.node_index[node1], self.node_index[node2]
+        matrix = self._cache.get("distance_matrix")
+        if matrix is not None:
+            return int(matrix[i, j])
+        x1, y1 = self._coords[i]
+        x2, y2 = self._coords[j]
+        if self._edge_weight_type == "EUC_2D":
+            return int(round(math.hypot(x1 - x2, y1 - y2)))
+        return int(self._weight(x1 - x2, y1 - y2))
 
     def to_tsp_format(self):
         lines = [
@@ -47,9 +304,10 @@ class EuclideanTSPGraph:
             f"EDGE_WEIGHT_TYPE: {self.edge_weight_type}",
             "NODE_COORD_SECTION"
         ]
-        for node_id in sorted(self.nodes):
-            x, y = self.nodes[node_id]
-            lines.append(f"{node_id} {x:.0f} {y:.0f}")
+        ids, coords = self.node_ids, self.coords.tolist()
+        for i in sorted(range(self.dimension), key=ids.__getitem__):
+            x, y = coords[i]
+            lines.append(f"{ids[i]} {x:.0f} {y:.0f}")
         lines.append("EOF")
         return "\n".join(lines)
 
@@ -57,59 +315,111 @@ class EuclideanTSPGraph:
         with open(filepath, 'w') as f:
             f.write(self.to_tsp_format())
 
-    def load_from_file(self, filepath, check_dimension=True):
-        with open(filepath, 'r') as f:
-            graph_data = f.read().splitlines()
+    def load_from_file(self, filepath, check_dimension=True, cache_dir=None):
+        """Load a TSPLIB file; with cache_dir, parsed instances are cached there by file hash."""
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"Empty TSP file: {filepath}")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                digest = hashlib.sha1(buf).hexdigest() if cache_dir else None
+                header = self._load_cached(cache_dir, digest) if digest else None
+                if header is None:
+                    header, nodes = self._parse_tsplib(buf)
+                    self._clear_nodes()
+                    self.name = header.get("name", self.name)
+                    self.edge_weight_type = header["edge_weight_type"]
+                    self.add_nodes(nodes[:, 1:], nodes[:, 0].astype(int).tolist())
+                else:
+                    nodes = None
+
+        expected_dimension = header.get("dimension")
+        if check_dimension and expected_dimension is not None:
+            if self.dimension != expected_dimension:
+                raise ValueError(f"Node count {self.dimension} does not match DIMENSION {expected_dimension}")
+
+        if digest and nodes is not None:
+            self._save_cached(cache_dir, digest, header, nodes)
 
-        node_section_started = False
-        expected_dimension = None
-        node_lines = []
+    @staticmethod
+    def _parse_tsplib(buf):
+        # Header lines are parsed one by one, the coordinate section in a single bulk pass
+        match = _NODE_COORD_SECTION.search(buf)
+        section = match.start() if match else -1
+        header_text = buf[:section if section >= 0 else len(buf)].decode()
+        header = {"edge_weight_type": "EUC_2D"}
 
-        for line in graph_data:
+        for line in header_text.splitlines():
             line = line.strip()
             if not line or line.startswith("COMMENT"):
                 continue
 
             if line.startswith("NAME"):
-                self.name = line.split(":", 1)[1].strip()
+                header["name"] = line.split(":", 1)[1].strip()
             elif line.startswith("TYPE"):
                 type_val = line.split(":", 1)[1].strip()
                 if type_val.upper() != "TSP":
                     raise ValueError(f"Invalid TYPE: expected TSP, got {type_val}")
             elif line.startswith("EDGE_WEIGHT_TYPE"):
-                weight_type = line.split(":", 1)[1].strip()
-                if weight_type.upper() != "EUC_2D":
-                    raise ValueError(f"Unsupported EDGE_WEIGHT_TYPE: expected EUC_2D, got {weight_type}")
+                weight_type = line.split(":", 1)[1].strip().upper()
+                if weight_type not in EDGE_WEIGHT_FUNCTIONS:
+                    raise ValueError(f"Unsupported EDGE_WEIGHT_TYPE: expected one of "
+                                     f"{', '.join(EDGE_WEIGHT_FUNCTIONS)}, got {weight_type}")
+                header["edge_weight_type"] = weight_type
             elif line.startswith("DIMENSION"):
-                expected_dimension = int(line.split(":", 1)[1].strip())
-            elif line.startswith("NODE_COORD_SECTION"):
-                node_section_started = True
-            elif node_section_started:
-                if line.upper().startswith("EOF"):
-                    break
-                node_lines.append(line)
-
-        self.nodes = {}
-        for line in node_lines:
-            parts = list(map(float, line.strip().split()))
-            if len(parts) != 3:
-                raise ValueError(f"Invalid node format: {line}")
-            self.add_node(int(parts[0]), parts[1], parts[2])
+                header["dimension"] = int(line.split(":", 1)[1].strip())
 
-        if check_dimension and expected_dimension is not None:
-            if len(self.nodes) != expected_dimension:
-                raise ValueError(f"Node count {len(self.nodes)} does not match DIMENSION {expected_dimension}")
+        if section < 0:
+            return header, np.empty((0, 3))
+        start = buf.find(b"\n", section) + 1 or len(buf)
+        match = _EOF.search(buf, start)
+        end = match.start() if match else -1
+        try:
+            nodes = np.loadtxt(io.BytesIO(buf[start:end if end >= 0 else len(buf)]), ndmin=2)
+        except ValueError as e:
+            raise ValueError(f"Invalid node format: {e}") from None
+        if nodes.size == 0:
+            nodes = nodes.reshape(0, 3)
+        if nodes.shape[1] != 3:
+            raise ValueError(f"Invalid node format: expected 3 columns, got {nodes.shape[1]}")
+        return header, nodes
 
+    def _load_cached(self, cache_dir, digest):
+        base = os.path.join(cache_dir, digest)
+        try:
+            with open(base + ".json") as f:
+                header = json.load(f)
+            nodes = np.load(base + ".npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+        # Cached instances were checked for duplicates when first parsed
+        self._clear_nodes()
+        self.name = header.get("name", self.name)
+        self.edge_weight_type = header["edge_weight_type"]
+        self._reserve(len(nodes))
+        self._coords[:len(nodes)] = nodes[:, 1:]
+        self.node_ids = nodes[:, 0].astype(int).tolist()
+        self.node_index = dict(zip(self.node_ids, range(len(nodes))))
+        self.dimension = len(self.node_ids)
+        self._coord_index = None
+        return header
+
+    def _save_cached(self, cache_dir, digest, header, nodes):
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, digest)
+        write_atomic(base + ".npy", lambda f: np.save(f, np.ascontiguousarray(nodes, dtype=float)))
+        write_atomic(base + ".json", lambda f: f.write(json.dumps(header).encode()))
 
     def set_solution(self, route):
         if isinstance(route, str) and route.strip():
             self.set_solution_from_string(route)
             return
         
-        if set(route) != set(self.nodes.keys()):
+        indices = self.to_indices(route)
+        if indices.ndim != 1 or (indices < 0).any() or not np.bincount(indices, minlength=self.dimension).all():
             raise ValueError("Solution does not contain all nodes.")
-        self.solution = route
-        self.solution_cost = self.get_solution_cost() if self.is_valid_solution() else None
+        self.solution = list(route)
+        self.solution_cost = self._tour_costs(indices) if len(indices) == self.dimension else None
 
     def set_solution_from_string(self, solution_str):
         try:
@@ -123,83 +433,224 @@ class EuclideanTSPGraph:
             return False
 
     def is_valid_solution(self):
-        if len(self.solution) != self.dimension:
-            return False
-        for i in range(len(self.solution)):
-            a = self.solution[i]
-            b = self.solution[(i + 1) % len(self.solution)]  # Return to start
-            if (a, b) not in self.edges() and (b, a) not in self.edges():
-                return False
-        return True
+        return self.is_valid_tour(self.solution)
 
     def get_solution_cost(self):
         if not self.is_valid_solution():
             raise ValueError("Invalid solution. Cannot compute cost.")
-        total = 0
-        for i in range(len(self.solution)):
-            a = self.solution[i]
-            b = self.solution[(i + 1) % len(self.solution)]
-            total += self.distance(a, b)
-        return total
+        return self.tour_cost(self.solution)
+
+    def to_indices(self, route):
+        """Map node ids (any array shape) to row indices; unknown ids map to -1."""
+        route = np.asarray(route)
+        n = self.dimension
+        if route.size == 0 or n == 0:
+            return np.full(route.shape, -1, dtype=np.intp)
+        if route.dtype.kind not in "iu":
+            return np.array([self.node_index.get(node, -1) for node in route.ravel().tolist()],
+                            dtype=np.intp).reshape(route.shape)
+
+        lookup = self._cache.get("index_lookup")
+        if lookup is None:
+            ids = np.asarray(self.node_ids)
+            if ids.dtype.kind not in "iu":
+                lookup = (None, None)
+            elif ids.max() - ids.min() < 4 * n:
+                # Dense ids (the usual 0..n-1 or 1..n): direct table lookup
+                table = np.full(int(ids.max() - ids.min()) + 1, -1, dtype=np.intp)
+                table[ids - ids.min()] = np.arange(n)
+                lookup = (int(ids.min()), table)
+            else:
+                order = np.argsort(ids)
+                lookup = (ids[order], order)
+            self._cache["index_lookup"] = lookup
+
+        keys, table = lookup
+        if keys is None:
+            return np.array([self.node_index.get(node, -1) for node in route.ravel().tolist()],
+                            dtype=np.intp).reshape(route.shape)
+        if isinstance(keys, int):
+            offset = route.astype(np.int64) - keys
+            inside = (offset >= 0) & (offset < len(table))
+            return np.where(inside, table[np.where(inside, offset, 0)], -1)
+        pos = np.minimum(np.searchsorted(keys, route), n - 1)
+        return np.where(keys[pos] == route, table[pos], -1)
+
+    def _valid_rows(self, indices):
+        # A row is a tour iff it has dimension entries, all known, none repeated
+        n = self.dimension
+        if indices.shape[-1] != n or n == 0:
+            return np.zeros(indices.shape[:-1], dtype=bool)
+        known = (indices >= 0).all(axis=-1)
+        seen = np.zeros(indices.shape, dtype=bool)
+        np.put_along_axis(seen, np.where(indices >= 0, indices, 0), True, axis=-1)
+        return known & seen.all(axis=-1)
+
+    def _tour_costs(self, indices):
+        following = np.roll(indices, -1, axis=-1)
+        matrix = self._cache.get("distance_matrix")
+        if matrix is not None:
+            legs = matrix[indices, following]
+        else:
+            coords = self._coords
+            diff = coords[following] - coords[indices]
+            legs = self._weight(diff[..., 0], diff[..., 1])
+        costs = legs.sum(axis=-1, dtype=np.int64)
+        return int(costs) if costs.ndim == 0 else costs
+
+    def is_valid_tour(self, route):
+        """True if route visits every node exactly once."""
+        indices = self.to_indices(route)
+        return indices.ndim == 1 and bool(self._valid_rows(indices))
+
+    def tour_cost(self, route):
+        """Cost of the closed tour route, checked to be a permutation of the node ids."""
+        indices = self.to_indices(route)
+        if indices.ndim != 1 or not self._valid_rows(indices):
+            raise ValueError("Invalid solution. Cannot compute cost.")
+        return self._tour_costs(indices)
+
+    def tour_costs(self, routes):
+        """Costs of a (num_tours, dimension) batch of tours as an int64 array."""
+        indices = self.to_indices(routes)
+        if indices.ndim != 2:
+            raise ValueError("Expected a 2-D array of tours.")
+        valid = self._valid_rows(indices)
+        if not valid.all():
+            raise ValueError(f"Invalid tours at rows {np.flatnonzero(~valid).tolist()}.")
+        return self._tour_costs(indices)
 
     def edges(self):
         """Generate the edges (pairs of nodes) for this graph."""
-        edges = {}
-        for a in self.nodes:
-            for b in self.nodes:
-                if a != b:
-                    edges[(a, b)] = self.distance(a, b)
-        return edges
-    
+        rows = self.distance_matrix().tolist()
+        ids = self.node_ids
+        return {(a, b): rows[i][j] for i, a in enumerate(ids) for j, b in enumerate(ids) if i != j}
+
+    def distance_matrix(self):
+        """Integer distance matrix in index order, cached until the nodes change."""
+        matrix = self._cache.get("distance_matrix")
+        if matrix is None:
+            coords = self.coords
+            n = self.dimension
+            # int32 holds any distance unless the instance spans more than 2^31 units
+            span = float(np.ptp(coords, axis=0).sum()) if n else 0.0
+            matrix = np.empty((n, n), dtype=np.int32 if span < 2**31 - 1 else np.int64)
+            block = max(1, _BLOCK_ELEMENTS // max(n, 1))
+            for start in range(0, n, block):
+                diff = coords[start:start + block, None, :] - coords[None, :, :]
+                matrix[start:start + block] = self._weight(diff[..., 0], diff[..., 1])
+            matrix.flags.writeable = False
+            self._cache["distance_matrix"] = matrix
+        return matrix
+
+    def index_distances(self, rows, columns):
+        """Edge weights between node rows and columns (index arrays of the same shape)."""
+        diff = self._coords[np.asarray(columns)] - self._coords[np.asarray(rows)]
+        return self._weight(diff[..., 0], diff[..., 1]).astype(np.int64)
+
+    def spatial_index(self):
+        """Grid index over the node coordinates, cached until the nodes change."""
+        index = self._cache.get("spatial_index")
+        if index is None:
+            index = self._cache["spatial_index"] = GridIndex(self.coords)
+        return index
+
+    def neighbors(self, k):
+        """(dimension, k) indices of each node's k nearest nodes, nearest first, cached."""
+        neighbors = self._cache.get("neighbors")
+        if neighbors is None or neighbors.shape[1] < min(k, self.dimension - 1):
+            neighbors = self.spatial_index().knn(k)
+            neighbors.flags.writeable = False
+            self._cache["neighbors"] = neighbors
+        return neighbors[:, :k]
+
     def to_distance_matrix(self):
         """Converts the graph to a distance matrix."""
-        matrix = []
-        nodes_list = list(self.nodes.keys())
-        for i in nodes_list:
-            row = []
-            for j in nodes_list:
-                if i == j:
-                    row.append(0)
-                else:
-                    row.append(self.distance(i, j))
-            matrix.append(row)
-        return matrix
-    
-    def show(self, show_solution=True, show_all_edges=True):
-        plt.figure(figsize=(8, 6))
-        x = [coord[0] for coord in self.nodes.values()]
-        y = [coord[1] for coord in self.nodes.values()]
-        
-        # Draw nodes
-        for node_id, (xi, yi) in self.nodes.items():
-            plt.plot(xi, yi, 'bo')
-            plt.text(xi + 1, yi + 1, str(node_id), fontsize=12)
+        return self.distance_matrix()
+
+    def draw(self, ax, show_solution=True, show_all_edges=True, knn=None, labels=None):
+        """Draw the graph on a matplotlib Axes with a few artists: one LineCollection for the
+        edges (the complete graph, or only each node's knn nearest neighbors when knn is
+        given), one line for the solution and one scatter for the nodes. Nodes are labelled
+        with their ids if labels, which defaults to graphs of up to _LABEL_LIMIT nodes."""
+        coords = self.coords
+        n = self.dimension
+
+        # Draw all edges (complete graph) or the k-nearest neighbor edges if requested
+        pairs = None
+        if knn and n > 1:
+            neighbors = self.neighbors(knn)
+            pairs = np.stack([np.repeat(np.arange(n), neighbors.shape[1]), neighbors.ravel()], axis=1)
+            pairs = np.unique(np.sort(pairs, axis=1), axis=0)  # each edge once
+        elif show_all_edges and n > 1:
+            pairs = np.stack(np.triu_indices(n, 1), axis=1)
+        if pairs is not None:
+            ax.add_collection(LineCollection(coords[pairs], colors="gray", alpha=0.3, linewidths=0.5, zorder=1))
 
         # Draw solution path if available
         if show_solution and self.solution:
-            path = self.solution + [self.solution[0]]  # Return to start
-            for i in range(len(self.solution)):
-                a = self.nodes[path[i]]
-                b = self.nodes[path[i + 1]]
-                plt.plot([a[0], b[0]], [a[1], b[1]], 'r-')
-
-        # Draw all edges (complete graph) if requested
-        if show_all_edges:
-            for i, (id1, (x1, y1)) in enumerate(self.nodes.items()):
-                for j, (id2, (x2, y2)) in enumerate(self.nodes.items()):
-                    if id1 != id2 and id1 < id2:  # Avoid duplicate lines
-                        plt.plot([x1, x2], [y1, y2], 'gray', alpha=0.3, linewidth=0.5)
-
-        plt.title(f"TSP Graph - {self.name}")
-        plt.xlabel("X")
-        plt.ylabel("Y")
-        plt.grid(True)
-        plt.axis("equal")
+            indices = self.to_indices(self.solution)
+            path = np.append(indices, indices[0])  # Return to start
+            ax.plot(coords[path, 0], coords[path, 1], 'r-', zorder=2)
+
+        # Draw nodes
+        ax.scatter(coords[:, 0], coords[:, 1], c='b', s=36, zorder=3)
+        if labels is None:
+            labels = n <= _LABEL_LIMIT
+        if labels:
+            for node_id, (xi, yi) in zip(self.node_ids, coords.tolist()):
+                ax.text(xi + 1, yi + 1, str(node_id), fontsize=12)
+
+        ax.set_title(f"TSP Graph - {self.name}")
+        ax.set_xlabel("X")
+        ax.set_ylabel("Y")
+        ax.grid(True)
+        ax.axis("equal")
+        ax.autoscale_view()
+
+    def show(self, show_solution=True, show_all_edges=True, knn=None, labels=None, path=None):
+        """Plot the graph (see draw). With path, the figure is written to that file (PNG, SVG, ...
+        by its extension) without a display instead of being shown."""
+        if path is not None:
+            figure = Figure(figsize=(8, 6))  # not registered with pyplot, so no GUI backend is needed
+            self.draw(figure.subplots(), show_solution, show_all_edges, knn, labels)
+            figure.savefig(path)
+            return
+        figure, ax = plt.subplots(figsize=(8, 6))
+        self.draw(ax, show_solution, show_all_edges, knn, labels)
         plt.show()
 
     def __str__(self):
         return self.to_tsp_format()
 
+def _render(graph, path, options):
+    graph.show(path=path, **options)
+    return path
+
+
+def render_graphs(graphs, directory, fmt="png", workers=None, **options):
+    """Write each graph, with its current solution, to directory/<name>.<fmt> and return the
+    paths. Graphs that share a name (such as one instance solved by several solvers) are
+    written to <name>-1.<fmt>, <name>-2.<fmt>, ... in order instead of overwriting each other.
+    Files are rendered headless, by a process pool when workers > 1; options are passed on to show()."""
+    os.makedirs(directory, exist_ok=True)
+    graphs = list(graphs)
+    names = [graph.name for graph in graphs]
+    counts, seen = {name: names.count(name) for name in set(names)}, {}
+    paths = []
+    for name in names:
+        if counts[name] > 1:
+            seen[name] = seen.get(name, 0) + 1
+            name = f"{name}-{seen[name]}"
+        paths.append(os.path.join(directory, f"{name}.{fmt}"))
+    if len(set(paths)) < len(paths):  # a suffixed name matched another graph's name
+        raise ValueError("Graph names collide after numbering; give the graphs distinct names.")
+    if not workers or workers <= 1:
+        return [_render(graph, path, options) for graph, path in zip(graphs, paths)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, graphs, paths, [options] * len(graphs)))
+
+
 # Example usage
 if __name__ == "__main__":
     graph = EuclideanTSPGraph()
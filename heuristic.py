@@ -1,99 +1,270 @@
-import random
+import copy
+import math
+import heapq
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from seeds import seed_sequence
+
+# Size of the nearest-neighbor candidate lists the heuristics look at first
+CANDIDATES = 10
+# Largest number of tour entries a batch of random starts holds at once
+_BATCH_ELEMENTS = 1 << 22
+# Widest spread of Euclidean distances that share one integer edge weight (ATT, which
+# rounds distance / sqrt(10); EUC_2D and CEIL_2D share a weight over a spread of 1)
+_TIE_REACH = math.sqrt(10)
 
 class NearestNeighborSolver:
-    def __init__(self, start_node=None):
+    def __init__(self, start_node=None, seed=None):
+        # seed: int, SeedSequence or numpy Generator for the random start node
         self.start_node = start_node
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        self.rng = np.random.default_rng(seed)
 
     def analyze(self, graph):
         if self.start_node is None:
-            current = random.choice(list(graph.nodes.keys()))
+            current = graph.node_ids[self.rng.integers(graph.dimension)]
         else:
             current = self.start_node
+        current = graph.node_index[current]
 
-        unvisited = set(graph.nodes.keys())
+        # Candidate lists are sorted by distance, so the first unvisited entry is the nearest
+        # unvisited node overall; the grid is only searched once all candidates are visited
+        candidates = graph.neighbors(CANDIDATES)
+        lengths = graph.index_distances(np.arange(graph.dimension)[:, None], candidates).tolist()
+        candidates = candidates.tolist()
+        unvisited = graph.spatial_index().active_set()
+        visited = [False] * graph.dimension
         tour = [current]
         unvisited.remove(current)
+        visited[current] = True
 
-        while unvisited:
-            next_node = min(unvisited, key=lambda node: graph.distance(current, node))
+        for _ in range(graph.dimension - 1):
+            next_node = None
+            for node, length in zip(candidates[current], lengths[current]):
+                if visited[node]:
+                    continue
+                if next_node is None:
+                    next_node, next_length = node, length
+                elif length == next_length:
+                    next_node = min(next_node, node)  # equal rounded distances: lowest index wins
+                else:
+                    break
+            if next_node is None or length == next_length:
+                # All candidates are visited, or the tie may run on past the list: look
+                # at every unvisited node as close as the nearest, lowest index wins
+                nearest = unvisited.nearest(current)
+                reach = np.hypot(*(graph.coords[nearest] - graph.coords[current])) + _TIE_REACH
+                near = unvisited.within(current, reach)
+                weights = graph.index_distances(np.full(len(near), current), near)
+                next_node = int(near[weights == weights.min()].min())
             tour.append(next_node)
             unvisited.remove(next_node)
+            visited[next_node] = True
             current = next_node
 
         #graph.set_solution(tour)
-        return tour
+        return [graph.node_ids[i] for i in tour]
 
 class GreedySolver:
     def __init__(self, start_node=None):
         self.start_node = start_node
 
     def analyze(self, graph):
-        edges = sorted(graph.edges().items(), key=lambda item: item[1])
-        parent = {node: node for node in graph.nodes}
-
-        def find(n):
-            while parent[n] != n:
-                parent[n] = parent[parent[n]]
-                n = parent[n]
-            return n
-
-        def union(n1, n2):
-            root1, root2 = find(n1), find(n2)
-            parent[root1] = root2
+        n = graph.dimension
+        if self.start_node is not None and self.start_node not in graph.node_index:
+            raise ValueError(f"Start node {self.start_node} not in graph.")
+        if n == 1:
+            return list(graph.node_ids)
 
+        # Fragments are paths; other_end[u] is the far end of the path u ends (u itself if isolated)
+        degree = [0] * n
+        other_end = list(range(n))
+        adj = [[] for _ in range(n)]
         used_edges = []
-        degrees = {node: 0 for node in graph.nodes}
 
-        for (u, v), dist in edges:
-            if degrees[u] >= 2 or degrees[v] >= 2:
-                continue
-            if find(u) != find(v) or len(used_edges) == graph.dimension - 1:
-                used_edges.append((u, v))
-                union(u, v)
-                degrees[u] += 1
-                degrees[v] += 1
-            if len(used_edges) == graph.dimension:
-                break
-
-        from collections import defaultdict
-
-        adj = defaultdict(list)
-        for u, v in used_edges:
+        def join(u, v):
+            end_u, end_v = other_end[u], other_end[v]
+            other_end[end_u], other_end[end_v] = end_v, end_u
+            degree[u] += 1
+            degree[v] += 1
             adj[u].append(v)
             adj[v].append(u)
+            used_edges.append((u, v))
+
+        # Candidate edges (each node's k nearest), shortest first; ties in index order as
+        # with a full edge sort
+        neighbors = graph.neighbors(CANDIDATES)
+        first = np.repeat(np.arange(n), neighbors.shape[1])
+        pairs = np.unique(np.minimum(first, neighbors.ravel()) * n + np.maximum(first, neighbors.ravel()))
+        first, second = np.divmod(pairs, n)
+        lengths = graph.index_distances(first, second)
+        order = np.lexsort((second, first, lengths))
+        candidates = zip(lengths[order].tolist(), first[order].tolist(), second[order].tolist())
+
+        # Edges outside the candidate lists come from grid searches among the fragment ends.
+        # A node's search is queued at the length of its last candidate, since none of its
+        # other edges can be shorter, and the heap entries only ever underestimate an end's
+        # best join (options disappear as fragments grow), so stale ones are refreshed when
+        # popped. This reproduces the order of a full edge sort up to ties.
+        ends = graph.spatial_index().active_set()
+        farthest = graph.index_distances(np.arange(n), neighbors[:, -1]).tolist()
+        heap = [(length, node, node, node, -1) for node, length in enumerate(farthest)]
+        heapq.heapify(heap)
+
+        def search(u):
+            partner = other_end[u]
+            if partner != u:
+                ends.remove(partner)
+            v = ends.nearest(u)
+            if partner != u:
+                ends.add(partner)
+            if v is not None:
+                heapq.heappush(heap, (int(graph.index_distances(u, v)), min(u, v), max(u, v), u, v))
+
+        def add(u, v):
+            join(u, v)
+            for node in (u, v):
+                if degree[node] == 2:
+                    ends.remove(node)
+
+        edge = next(candidates, None)
+        while len(used_edges) < n - 1:
+            if edge is not None and (not heap or edge <= heap[0][:3]):
+                _, u, v = edge
+                edge = next(candidates, None)
+                if degree[u] < 2 and degree[v] < 2 and other_end[u] != v:
+                    add(u, v)
+                continue
+
+            _, _, _, u, v = heapq.heappop(heap)
+            if degree[u] == 2:
+                continue
+            if v < 0 or degree[v] == 2 or other_end[u] == v:
+                search(u)
+                continue
+            add(u, v)
+            if degree[u] < 2:
+                search(u)
+
+        # Close the Hamiltonian path into a cycle
+        if len(used_edges) == n - 1:
+            u, v = [node for node in range(n) if degree[node] < 2]
+            join(u, v)
 
         if self.start_node is not None:
-            if self.start_node not in graph.nodes:
-                raise ValueError(f"Start node {self.start_node} not in graph.")
-            start = self.start_node
+            start = graph.node_index[self.start_node]
         else:
             start = used_edges[0][0]
 
-        tour = []
-        visited = set()
-
-        def dfs(u):
-            visited.add(u)
-            tour.append(u)
-            for v in adj[u]:
-                if v not in visited:
-                    dfs(v)
-
-        dfs(start)
+        # Walk the cycle from start, leaving it through its first added edge
+        tour = [start]
+        visited = [False] * n
+        visited[start] = True
+        current = start
+        for _ in range(n - 1):
+            current = next(v for v in adj[current] if not visited[v])
+            visited[current] = True
+            tour.append(current)
 
         #graph.set_solution(tour)
-        return tour
+        return [graph.node_ids[i] for i in tour]
 
 class RandomizedSolver:
-    def __init__(self, start_node=None):
+    def __init__(self, start_node=None, seed=None):
+        # seed: int, SeedSequence or numpy Generator for the shuffles
         self.start_node = start_node
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        self.rng = np.random.default_rng(seed)
 
     def analyze(self, graph):
         tour = list(graph.nodes.keys())
-        random.shuffle(tour)
+        self.rng.shuffle(tour)
 
         if self.start_node is not None and self.start_node in tour:
             tour.remove(self.start_node)
             tour = [self.start_node] + tour
             
-        return tour
\ No newline at end of file
+        return tour
+
+def _run_starts(solver, graph, seeds):
+    # One tour per seed; module level so process pool workers can run it
+    solver = copy.copy(solver)
+    tours = []
+    for seed in seeds:
+        if hasattr(solver, "reseed"):
+            solver.reseed(seed)
+        tours.append(solver.analyze(graph))
+    return tours
+
+class MultiStartSolver:
+    """Best of several independently seeded starts of a stochastic solver.
+
+    Every analyze() spawns one child SeedSequence per start from seed. Starts
+    are spread over a process pool when workers > 1, except for RandomizedSolver,
+    whose starts are drawn as batches of NumPy permutations. All tours are
+    scored with graph.tour_costs; the costs of the last analyze() are kept in
+    costs and summarized by stats().
+    """
+
+    def __init__(self, solver, starts=16, workers=None, seed=None):
+        self.solver = solver
+        self.starts = starts
+        self.workers = workers
+        self.reseed(seed)
+        self.costs = np.empty(0, dtype=np.int64)
+
+    def reseed(self, seed):
+        self.seed_sequence = seed_sequence(seed)
+
+    def analyze(self, graph):
+        if isinstance(self.solver, RandomizedSolver):
+            return self._random_starts(graph, self.seed_sequence.spawn(1)[0])
+
+        seeds = self.seed_sequence.spawn(self.starts)
+        if self.workers and self.workers > 1:
+            chunks = [list(chunk) for chunk in np.array_split(np.array(seeds, dtype=object),
+                                                              min(self.workers, self.starts))]
+            with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+                tours = [tour for part in pool.map(_run_starts, [self.solver] * len(chunks),
+                                                   [graph] * len(chunks), chunks) for tour in part]
+        else:
+            tours = _run_starts(self.solver, graph, seeds)
+        self.costs = graph.tour_costs(tours)
+        return tours[int(self.costs.argmin())]
+
+    def _random_starts(self, graph, seed):
+        ids = np.asarray(graph.node_ids)
+        start = self.solver.start_node
+        if start is not None and start in graph.node_index:
+            rest = np.delete(ids, graph.node_index[start])
+        else:
+            start, rest = None, ids
+
+        rng = np.random.default_rng(seed)
+        batch = max(1, _BATCH_ELEMENTS // max(len(ids), 1))
+        costs, best, best_cost = [], None, None
+        for first in range(0, self.starts, batch):
+            count = min(batch, self.starts - first)
+            tours = rest[np.argsort(rng.random((count, len(rest))), axis=1)]
+            if start is not None:
+                tours = np.column_stack((np.full(count, start, dtype=ids.dtype), tours))
+            batch_costs = graph.tour_costs(tours)
+            costs.append(batch_costs)
+            i = int(batch_costs.argmin())
+            if best is None or batch_costs[i] < best_cost:
+                best, best_cost = tours[i], batch_costs[i]
+        self.costs = np.concatenate(costs)
+        return best.tolist()
+
+    def stats(self):
+        """Summary of the start costs of the last analyze()."""
+        costs = self.costs
+        p5, p25, median, p75, p95 = np.percentile(costs, [5, 25, 50, 75, 95])
+        return {"starts": len(costs), "min": int(costs.min()), "max": int(costs.max()),
+                "mean": float(costs.mean()), "std": float(costs.std(ddof=1)) if len(costs) > 1 else 0.0,
+                "p5": p5, "p25": p25, "median": median, "p75": p75, "p95": p95}
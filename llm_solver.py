@@ -1,23 +1,162 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIError
+import asyncio
+import re
 import time
 
+import numpy as np
+
 from graph import EuclideanTSPGraph
+from response_cache import ResponseCache
 
 # Make sure to export environment variable OPENAI_API_KEY
 
 TSP_4o_ID = 'asst_sv7Y0koVte4odmHCmnJoKz8V'
 TSP_o1_ID = 'asst_QrJ43lrH8FWXD8xc7Y3l8ayB'
 
+# Part of every cache key; bump when the text sent for an instance changes
+PROMPT_VERSIONS = {"tsplib": 1, "compact": 2}
+
+# Run statuses that mean the assistant has not answered yet
+PENDING_STATUSES = ('queued', 'in_progress', 'cancelling')
+
+# Backoff before retrying after an API error, a failed run or an invalid answer (seconds)
+RETRY_FIRST_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Most nodes (as a fraction of the instance) repair_route() may drop or insert
+REPAIR_FRACTION = 0.25
+
+# tiktoken encoding, loaded by the first count_tokens() call (False once it is known to be unavailable)
+_ENCODING = None
+
+def count_tokens(text):
+  # Exact with tiktoken; otherwise an estimate that splits like o200k (digits in runs of up to 3).
+  # The encoding is loaded lazily, since loading may download its vocabulary
+  global _ENCODING
+  if _ENCODING is None:
+    try:
+      import tiktoken
+      _ENCODING = tiktoken.get_encoding("o200k_base")
+    except Exception:  # not installed, or its vocabulary cannot be downloaded
+      _ENCODING = False
+  if _ENCODING:
+    return len(_ENCODING.encode(text))
+  return len(re.findall(r" ?[A-Za-z]+|\d{1,3}| ?[^\sA-Za-z\d]+|\s+", text))
+
+def encode_instance(graph, encoding="compact"):
+  # "tsplib" is the full TSPLIB file; "compact" drops the name and section headers and keeps one "id x y" row per node
+  if encoding == "tsplib":
+    return str(graph)
+  ids, coords = graph.node_ids, graph.coords.tolist()
+  rows = [f"{ids[i]} {coords[i][0]:.0f} {coords[i][1]:.0f}" for i in sorted(range(graph.dimension), key=ids.__getitem__)]
+  return f"{graph.edge_weight_type} TSP, {graph.dimension} nodes (id x y):\n" + "\n".join(rows)
+
+def poll_delays(first=0.1, factor=2.0, cap=2.0):
+  # Exponential backoff between run status checks: short answers return quickly, long ones poll rarely
+  delay = first
+  while True:
+    yield delay
+    delay = min(delay * factor, cap)
+
+def parse_route(text):
+  # Node ids of the last [...] list in the reply, or of the whole reply when it has no list
+  lists = re.findall(r"\[([^\[\]]*)\]", text)
+  route = [int(x) for x in re.findall(r"-?\d+", lists[-1] if lists else text)]
+  if not route:
+    raise ValueError("No tour in response.")
+  return route
+
+def repair_route(graph, route, max_fraction=REPAIR_FRACTION):
+  # Drops unknown and repeated nodes and adds the missing ones by cheapest insertion; raises
+  # ValueError when more than max_fraction of the nodes would change
+  indices = graph.to_indices(route).tolist()
+  tour, seen = [], set()
+  for i in indices:
+    if i >= 0 and i not in seen:
+      seen.add(i)
+      tour.append(i)
+  missing = [i for i in range(graph.dimension) if i not in seen]
+  if len(missing) + len(indices) - len(tour) > max_fraction * graph.dimension or not tour:
+    raise ValueError("Invalid solution.")
+  if len(tour) == len(indices) and not missing:
+    return list(route)
+
+  for node in missing:
+    tour_array = np.array(tour)
+    following = np.roll(tour_array, -1)
+    added = (graph.index_distances(tour_array, node) + graph.index_distances(node, following)
+             - graph.index_distances(tour_array, following))
+    tour.insert(int(np.argmin(added)) + 1, node)
+  return [graph.node_ids[i] for i in tour]
+
 class LLMSolver():
-  def __init__(self, model="gpt-4o"):
+  def __init__(self, model="gpt-4o", base_url=None, cache=None, replay=False, encoding="compact"):
     if model == "gpt-4o":
       self.ASSISTANT_ID = TSP_4o_ID
     elif model == "o1":
       self.ASSISTANT_ID = TSP_o1_ID
 
-    self.client = OpenAI()
-    self.thread = self.client.beta.threads.create()
+    self.base_url = base_url  # base_url: e.g. a local stub server
+    self.encoding = encoding  # "compact" or "tsplib", see encode_instance()
+    self.prompt_version = PROMPT_VERSIONS[encoding]
+    # Accepted answers are stored in cache (a ResponseCache); with replay=True they are
+    # only read from it, and an uncached instance raises LookupError instead of calling the API
+    self.cache = ResponseCache() if replay and cache is None else cache
+    self.replay = replay
+    self.trials = {}  # labelled fingerprint -> trials answered so far, the trial index of the cache key
+    self._client = None  # created on first use, so cached and replayed runs need no API key
+    self._thread = None
     self.failed_attempts = 0
+    self.last_seconds = None  # latency of the last analyze(): as recorded in the cache for cached trials
+    self.errors = []  # (graph name, exception) of every instance analyze_many() gave up on
+    self.repaired = 0  # near-valid answers fixed locally by repair_route() instead of a retry
+    self.prompt_tokens = 0  # token counts reported by the completed runs
+    self.completion_tokens = 0
+
+  @property
+  def client(self):
+    if self._client is None:
+      self._client = OpenAI(base_url=self.base_url)
+    return self._client
+
+  @property
+  def thread(self):
+    if self._thread is None:
+      self._thread = self.client.beta.threads.create()
+    return self._thread
+
+  def next_trial(self, graph):
+    key = graph.labelled_fingerprint()
+    trial = self.trials.get(key, 0)
+    self.trials[key] = trial + 1
+    return trial
+
+  def cached_route(self, graph, trial):
+    # (route, record) of a cached trial, or None; raises LookupError on a miss in replay mode
+    record = None if self.cache is None else self.cache.lookup(self.ASSISTANT_ID, graph, self.prompt_version, trial)
+    if record is None:
+      if self.replay:
+        raise LookupError(f"No cached response for {graph.name} (trial {trial}).")
+      return None
+    self.failed_attempts += record["attempts"] - 1
+    return self.route_from(graph, record["response"]), record
+
+  def store_response(self, graph, trial, tour, attempts, seconds):
+    if self.cache is not None:
+      self.cache.record(self.ASSISTANT_ID, graph, self.prompt_version, trial, tour, attempts, seconds)
+
+  def route_from(self, graph, tour):
+    # The route in a reply, repaired if it is near-valid; raises ValueError otherwise
+    parsed = parse_route(tour)
+    route = repair_route(graph, parsed)
+    if route != parsed:
+      self.repaired += 1
+    return route
+
+  def count_usage(self, run):
+    if getattr(run, "usage", None) is not None:
+      self.prompt_tokens += run.usage.prompt_tokens
+      self.completion_tokens += run.usage.completion_tokens
 
   def set_assistant(self, model):
     if model == "gpt-4o":
@@ -26,35 +165,60 @@ class LLMSolver():
       self.ASSISTANT_ID = TSP_o1_ID
 
   def clear_thread(self):
-    # Creates a new thread to clear the context.
-    self.thread = self.client.beta.threads.create()
+    # Starts a new thread (on the next request) to clear the context.
+    self._thread = None
 
   def analyze(self, graph: EuclideanTSPGraph):
+    trial = self.next_trial(graph)
+    cached = self.cached_route(graph, trial)
+    if cached is not None:
+      self.last_seconds = cached[1]["seconds"]
+      return cached[0]
+
     max_retries = 10
-    attempts = 0
-    success = False
+    start_time = time.perf_counter()
+    text = encode_instance(graph, self.encoding)
+    retry_delays = poll_delays(RETRY_FIRST_DELAY, 2.0, RETRY_MAX_DELAY)
+    tour = None
 
-    while attempts < max_retries and not success:
+    # API errors (rate limits, timeouts) and invalid answers are retried with exponential backoff
+    for attempt in range(1, max_retries + 1):
       try:
-        tour = self.send_request(str(graph))
-        cleaned = tour.strip().strip("[]")
-        route = [int(x.strip()) for x in cleaned.split(",")]
-        graph.set_solution(route)
-        if not graph.is_valid_solution():
-          raise ValueError("Invalid solution.")
-        success = True
-      except ValueError as e:
-        attempts += 1
-        self.failed_attempts += 1
-        self.clear_thread()
-        print("Failed attempt - " + tour)
-    
-    if not success:
-      raise ValueError("Invalid solution.")
+        tour = self.send_request(text)
+        route = self.route_from(graph, tour)
+        break
+      except APIError as e:
+        error = e
+        print(f"Failed attempt - {e!r}")
+      except ValueError:
+        error = ValueError("Invalid solution.")
+        print(f"Failed attempt - {tour!r}")
+      self.failed_attempts += 1
+      self.clear_thread()
+      if attempt < max_retries:
+        time.sleep(next(retry_delays))
+    else:
+      raise error
 
+    self.last_seconds = time.perf_counter() - start_time
+    self.store_response(graph, trial, tour, attempt, self.last_seconds)
     self.clear_thread()
     return route
 
+  def analyze_many(self, graphs):
+    # (route, seconds) per graph, solved one at a time; cached trials report their recorded seconds,
+    # so evaluate.py replays the original times. Instances that still fail after the retries (on invalid
+    # answers or API errors) get (None, None), as do replay misses, since an instance that failed in the
+    # recorded run was never cached; their exceptions are kept in errors.
+    results = []
+    for graph in graphs:
+      try:
+        results.append((self.analyze(graph), self.last_seconds))
+      except (ValueError, LookupError, APIError) as e:
+        self.errors.append((graph.name, e))
+        results.append((None, None))
+    return results
+
   def send_request(self, text):
     # Add message to a thread
     message = self.client.beta.threads.messages.create(
@@ -70,14 +234,16 @@ class LLMSolver():
     )
       
     # Check for status of run
-    while run.status in ['queued', 'in_progress', 'cancelling']:
-      time.sleep(1) # Wait for 1 second
+    delays = poll_delays()
+    while run.status in PENDING_STATUSES:
+      time.sleep(next(delays))
       run = self.client.beta.threads.runs.retrieve(
         thread_id=self.thread.id,
         run_id=run.id
       )
 
     # return message
+    self.count_usage(run)
     if run.status == 'completed': 
       message_response = self.client.beta.threads.messages.list(
         thread_id=self.thread.id
@@ -88,3 +254,100 @@ class LLMSolver():
       return latest_message.content[0].text.value
     else:
       return run.status
+
+class AsyncLLMSolver(LLMSolver):
+  """LLMSolver that keeps up to `concurrency` instances in flight at once.
+
+  analyze_many() solves a list of graphs on one AsyncOpenAI client (so HTTP
+  connections are reused), each request in its own thread, and returns
+  (route, seconds) per graph. Cached trials return the seconds recorded when
+  they were first answered, so a replayed benchmark reports the same times.
+  API errors (rate limits, timeouts, lost connections) and failed answers are
+  retried with exponential backoff; an instance that still fails, or is missing
+  from the cache in replay mode, gets (None, None) and its exception is kept in
+  `errors`, without affecting the others.
+  """
+  def __init__(self, model="gpt-4o", concurrency=8, base_url=None, max_retries=10, cache=None, replay=False,
+               encoding="compact"):
+    super().__init__(model, base_url, cache, replay, encoding)
+    self.concurrency = concurrency
+    self.max_retries = max_retries
+
+  def analyze(self, graph: EuclideanTSPGraph):
+    route, _ = self.analyze_many([graph])[0]
+    if route is None:
+      raise self.errors[-1][1]
+    return route
+
+  def analyze_many(self, graphs):
+    results = [None] * len(graphs)
+    pending = []
+    for i, graph in enumerate(graphs):
+      trial = self.next_trial(graph)  # assigned in list order, so repeated graphs get stable trials
+      try:
+        cached = self.cached_route(graph, trial)
+      except LookupError as e:  # a replay miss: the recorded run failed on this instance
+        self.errors.append((graph.name, e))
+        results[i] = None, None
+        continue
+      if cached is not None:
+        results[i] = cached[0], cached[1]["seconds"]
+      else:
+        pending.append((i, graph, trial))
+    if pending:
+      solved = asyncio.run(self._solve_all([(graph, trial) for _, graph, trial in pending]))
+      for (i, graph, _), result in zip(pending, solved):
+        if isinstance(result, Exception):
+          self.errors.append((graph.name, result))
+          print(f"Gave up on {graph.name} - {result!r}")
+          result = None, None
+        results[i] = result
+    return results
+
+  async def _solve_all(self, jobs):
+    limit = asyncio.Semaphore(self.concurrency)
+    async with AsyncOpenAI(base_url=self.base_url) as client:
+      return await asyncio.gather(*(self._solve(client, limit, graph, trial) for graph, trial in jobs),
+                                  return_exceptions=True)
+
+  async def _solve(self, client, limit, graph, trial):
+    async with limit:
+      start_time = time.perf_counter()
+      text = encode_instance(graph, self.encoding)
+      retry_delays = poll_delays(RETRY_FIRST_DELAY, 2.0, RETRY_MAX_DELAY)
+      error = ValueError("Invalid solution.")
+      tour = None
+      for attempt in range(1, self.max_retries + 1):
+        try:
+          tour = await self._request(client, text)
+          route = self.route_from(graph, tour)
+          seconds = time.perf_counter() - start_time
+          self.store_response(graph, trial, tour, attempt, seconds)
+          return route, seconds
+        except APIError as e:
+          error = e
+          print(f"Failed attempt - {e!r}")
+        except ValueError:
+          error = ValueError("Invalid solution.")
+          print(f"Failed attempt - {tour!r}")
+        self.failed_attempts += 1
+        if attempt < self.max_retries:
+          await asyncio.sleep(next(retry_delays))
+      raise error
+
+  async def _request(self, client, text):
+    # A fresh thread per request, created with its message in one call
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": text}])
+    run = await client.beta.threads.runs.create(thread_id=thread.id, assistant_id=self.ASSISTANT_ID)
+
+    delays = poll_delays()
+    while run.status in PENDING_STATUSES:
+      await asyncio.sleep(next(delays))
+      run = await client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+
+    self.count_usage(run)
+    if run.status == 'completed':
+      messages = await client.beta.threads.messages.list(thread_id=thread.id, order="desc", limit=1)
+      return messages.data[0].content[0].text.value
+    else:
+      return run.status
@@ -0,0 +1,314 @@
+import math
+import time
+from collections import deque
+
+from heuristic import CANDIDATES, GreedySolver, NearestNeighborSolver
+
+# Largest instance whose distance matrix is unpacked into Python lists for the move loops
+_MATRIX_LIMIT = 1000
+
+
+def distance_function(graph):
+    """Fast scalar distance between node indices for the pure Python move loops."""
+    if graph.dimension <= _MATRIX_LIMIT:
+        rows = graph.distance_matrix().tolist()
+        return lambda a, b: rows[a][b]
+    if graph.edge_weight_type == "EUC_2D":
+        xs, ys = graph.coords[:, 0].tolist(), graph.coords[:, 1].tolist()
+        hypot = math.hypot
+        return lambda a, b: int(round(hypot(xs[a] - xs[b], ys[a] - ys[b])))
+    return lambda a, b: int(graph.index_distances(a, b))
+
+
+class ArrayTour:
+    """Tour as a list of nodes plus each node's position; 2-opt reverses in place."""
+
+    def __init__(self, order):
+        self.tour = list(order)
+        self.n = len(self.tour)
+        self.pos = [0] * self.n
+        for i, node in enumerate(self.tour):
+            self.pos[node] = i
+
+    def succ(self, a):
+        return self.tour[self.pos[a] + 1 - self.n]
+
+    def pred(self, a):
+        return self.tour[self.pos[a] - 1]
+
+    def reverse(self, i, j):
+        # Reverse tour positions i..j (cyclic), or the complement when that is shorter
+        tour, pos, n = self.tour, self.pos, self.n
+        length = (j - i) % n + 1
+        if 2 * length > n:
+            i, j, length = j + 1, i - 1, n - length
+        for k in range(length // 2):
+            a, b = (i + k) % n, (j - k) % n
+            tour[a], tour[b] = tour[b], tour[a]
+            pos[tour[a]], pos[tour[b]] = a, b
+
+    def exchange(self, p, r):
+        # 2-opt move: edges (p, succ(p)) and (r, succ(r)) become (p, r) and (succ(p), succ(r))
+        self.reverse(self.pos[self.succ(p)], self.pos[r])
+
+    def order(self):
+        return list(self.tour)
+
+
+class TwoLevelList:
+    """Tour as a doubly-linked list of segments of about sqrt(n) nodes, each with a reversal bit.
+
+    Reversing a path splits at most two segments at its ends and then reverses
+    the order of the whole segments in between, flipping their reversal bits,
+    so a 2-opt move costs O(sqrt(n)) instead of O(n). The segments are rebuilt
+    evenly once splits have doubled their number.
+    """
+
+    def __init__(self, order):
+        self.n = len(order)
+        self.group = max(8, math.isqrt(self.n))
+        self.seg = [0] * self.n  # segment of each node
+        self.idx = [0] * self.n  # index of each node in its segment's list
+        self._build(list(order))
+
+    def _build(self, order):
+        group = self.group
+        self.nodes = [order[i:i + group] for i in range(0, self.n, group)]
+        self.rev = [False] * len(self.nodes)
+        self.sequence = list(range(len(self.nodes)))  # segment ids in tour order
+        self.rank = list(range(len(self.nodes)))  # position of each segment in sequence
+        self.limit = 2 * len(self.nodes)
+        for s, members in enumerate(self.nodes):
+            for i, node in enumerate(members):
+                self.seg[node] = s
+                self.idx[node] = i
+
+    def _first(self, s):
+        return self.nodes[s][-1] if self.rev[s] else self.nodes[s][0]
+
+    def _last(self, s):
+        return self.nodes[s][0] if self.rev[s] else self.nodes[s][-1]
+
+    def succ(self, a):
+        s = self.seg[a]
+        members = self.nodes[s]
+        i = self.idx[a] + (-1 if self.rev[s] else 1)
+        if 0 <= i < len(members):
+            return members[i]
+        return self._first(self.sequence[(self.rank[s] + 1) % len(self.sequence)])
+
+    def pred(self, a):
+        s = self.seg[a]
+        members = self.nodes[s]
+        i = self.idx[a] + (1 if self.rev[s] else -1)
+        if 0 <= i < len(members):
+            return members[i]
+        return self._last(self.sequence[self.rank[s] - 1])
+
+    def _cut_before(self, a):
+        # Split a's segment so that a is the first node of its segment in tour order
+        s = self.seg[a]
+        members = self.nodes[s]
+        cut = self.idx[a] + 1 if self.rev[s] else self.idx[a]
+        if cut == 0 or cut == len(members):
+            return
+        # s keeps members[:cut]; the new segment takes the rest and sits after s in tour
+        # order, or before it when s is reversed
+        t = len(self.nodes)
+        self.nodes.append(members[cut:])
+        self.nodes[s] = members[:cut]
+        self.rev.append(self.rev[s])
+        self.rank.append(0)
+        for i, node in enumerate(self.nodes[t]):
+            self.seg[node] = t
+            self.idx[node] = i
+        at = self.rank[s] + (0 if self.rev[s] else 1)
+        self.sequence.insert(at, t)
+        for r in range(at, len(self.sequence)):
+            self.rank[self.sequence[r]] = r
+
+    def flip(self, a, b):
+        """Reverse the tour path that runs forward from a to b."""
+        if self.succ(b) == a:
+            return  # the whole tour
+        self._cut_before(a)
+        self._cut_before(self.succ(b))
+        sequence, rank = self.sequence, self.rank
+        count = len(sequence)
+        i, j = rank[self.seg[a]], rank[self.seg[b]]
+        length = (j - i) % count + 1
+        if 2 * length > count:
+            i, j, length = j + 1, i - 1, count - length
+        for k in range(length):
+            self.rev[sequence[(i + k) % count]] ^= True
+        for k in range(length // 2):
+            x, y = (i + k) % count, (j - k) % count
+            sequence[x], sequence[y] = sequence[y], sequence[x]
+            rank[sequence[x]], rank[sequence[y]] = x, y
+        if count > self.limit:
+            self._build(self.order())
+
+    def exchange(self, p, r):
+        # 2-opt move: edges (p, succ(p)) and (r, succ(r)) become (p, r) and (succ(p), succ(r))
+        self.flip(self.succ(p), r)
+
+    def order(self):
+        order = []
+        for s in self.sequence:
+            order.extend(reversed(self.nodes[s]) if self.rev[s] else self.nodes[s])
+        return order
+
+
+class LocalSearch:
+    """2-opt and Or-opt improvement over k-nearest candidate lists with don't-look bits.
+
+    Every move is made of 2-opt exchanges on the tour representation (ArrayTour
+    or TwoLevelList); an Or-opt move (relocating 1-3 consecutive nodes) takes two
+    or three. After improve(), trajectory holds (seconds, cost) for the start and
+    every improving move.
+    """
+
+    def __init__(self, time_limit=None, candidates=CANDIDATES, or_opt=True, tour_type=ArrayTour):
+        self.time_limit = time_limit  # seconds
+        self.candidates = candidates
+        self.or_opt = or_opt
+        self.tour_type = tour_type
+        self.trajectory = []
+
+    def improve(self, graph, route):
+        started = time.perf_counter()
+        n = graph.dimension
+        tour = graph.to_indices(route).tolist()
+        cost = graph.tour_cost(route)
+        self.trajectory = [(0.0, cost)]
+        if n < 5:
+            return list(route)
+
+        dist = distance_function(graph)
+        neighbors = graph.neighbors(self.candidates).tolist()
+        tour = self.tour_type(tour)
+        succ, pred, exchange = tour.succ, tour.pred, tour.exchange
+
+        def two_opt(a):
+            for forward in (True, False):
+                b = succ(a) if forward else pred(a)
+                d_ab = dist(a, b)
+                for c in neighbors[a]:
+                    d_ac = dist(a, c)
+                    if d_ac >= d_ab:
+                        break
+                    d = succ(c) if forward else pred(c)
+                    if c == b or d == a:
+                        continue
+                    gain = d_ab + dist(c, d) - d_ac - dist(b, d)
+                    if gain > 0:
+                        if forward:
+                            exchange(a, c)
+                        else:
+                            exchange(b, d)
+                        return gain, (a, b, c, d)
+            return 0, ()
+
+        def or_opt(a):
+            # Move the segment a..last (1-3 nodes, tour order) between c and succ(c)
+            last = a
+            for _ in range(3):
+                before, after = pred(a), succ(last)
+                if after == before or after == a:
+                    return 0, ()
+                removed = dist(before, a) + dist(last, after) - dist(before, after)
+                segment = set()
+                node = a
+                while True:
+                    segment.add(node)
+                    if node == last:
+                        break
+                    node = succ(node)
+                for end in (a, last):
+                    for near in neighbors[end]:
+                        if dist(end, near) >= removed:
+                            break
+                        for c in (near, pred(near)):
+                            cn = succ(c)
+                            if c in segment or c == before:
+                                continue
+                            kept = dist(c, cn)
+                            flipped = dist(c, last) + dist(a, cn) - kept
+                            straight = dist(c, a) + dist(last, cn) - kept
+                            gain = removed - min(flipped, straight)
+                            if gain > 0:
+                                # Three 2-opt moves; the tour orientation may flip after each,
+                                # so every move is chosen by which neighbour comes next
+                                exchange(before, c)  # before-c ... after-last ... a-cn
+                                if succ(before) == c:
+                                    exchange(before, after)
+                                else:
+                                    exchange(last, c)  # before-after ... c-last ... a-cn
+                                if straight < flipped:
+                                    if succ(c) == last:
+                                        exchange(c, a)
+                                    else:
+                                        exchange(cn, last)
+                                return gain, (a, last, before, after, c, cn)
+                last = succ(last)
+                if last == before:
+                    return 0, ()
+            return 0, ()
+
+        # Don't-look bits: only nodes next to a recently changed edge are in the queue
+        queue = deque(tour.order())
+        queued = [True] * n
+        while queue:
+            if self.time_limit is not None and time.perf_counter() - started >= self.time_limit:
+                break
+            a = queue.popleft()
+            queued[a] = False
+            gain, touched = two_opt(a)
+            if not gain and self.or_opt:
+                gain, touched = or_opt(a)
+            if gain:
+                cost -= gain
+                self.trajectory.append((time.perf_counter() - started, cost))
+                for node in touched + (a,):
+                    if not queued[node]:
+                        queued[node] = True
+                        queue.append(node)
+
+        tour = tour.order()
+        start = tour.index(graph.node_index[route[0]])
+        return [graph.node_ids[i] for i in tour[start:] + tour[:start]]
+
+
+class LocalSearchSolver:
+    """Runs another solver and pipes its tour through LocalSearch."""
+
+    def __init__(self, solver, time_limit=None, candidates=CANDIDATES, or_opt=True):
+        self.solver = solver
+        self.search = LocalSearch(time_limit, candidates, or_opt)
+
+    @property
+    def trajectory(self):
+        return self.search.trajectory
+
+    def analyze(self, graph):
+        return self.search.improve(graph, self.solver.analyze(graph))
+
+
+class OrOptSolver:
+    """Or-3opt (2-opt plus Or-opt) on a TwoLevelList tour, for instances of 10k+ nodes.
+
+    Starts from the better of the greedy and nearest neighbor tours.
+    """
+
+    def __init__(self, time_limit=None, candidates=CANDIDATES, initial_solvers=None):
+        self.initial_solvers = initial_solvers
+        self.search = LocalSearch(time_limit, candidates, or_opt=True, tour_type=TwoLevelList)
+
+    @property
+    def trajectory(self):
+        return self.search.trajectory
+
+    def analyze(self, graph):
+        solvers = self.initial_solvers or [GreedySolver(), NearestNeighborSolver(graph.node_ids[0])]
+        initial_tour = min((solver.analyze(graph) for solver in solvers), key=graph.tour_cost)
+        return self.search.improve(graph, initial_tour)
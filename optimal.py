@@ -0,0 +1,67 @@
+import os
+import json
+
+from graph import write_atomic
+
+# Default location of the store, shared by every solver and run
+OPTIMAL_CACHE_DIR = ".optcache"
+
+
+class OptimalCostStore:
+    """Optimal and best-known tour costs keyed by EuclideanTSPGraph.fingerprint().
+
+    Every recorded cost is its own atomically written file, so concurrent
+    writers never need a lock; lookups prefer a proven optimum over bounds.
+    """
+
+    def __init__(self, directory=OPTIMAL_CACHE_DIR):
+        self.directory = directory
+
+    def _entry_dir(self, graph):
+        key = graph.fingerprint()
+        return os.path.join(self.directory, key[:2], key)
+
+    def lookup(self, graph):
+        """Return (cost, is_optimal) for the best known cost of graph, or None."""
+        try:
+            names = os.listdir(self._entry_dir(graph))
+        except FileNotFoundError:
+            return None
+
+        optimal, bounds = [], []
+        for name in names:
+            cost, _, kind = name.removesuffix(".json").partition("-")
+            if kind == "optimal":
+                optimal.append(int(cost))
+            elif kind == "bound":
+                bounds.append(int(cost))
+        if optimal:
+            return min(optimal), True
+        if bounds:
+            return min(bounds), False
+        return None
+
+    def record(self, graph, cost, optimal=False, solver=None):
+        """Record a tour cost; bounds are only written when they improve on the best known."""
+        known = self.lookup(graph)
+        if known is not None and (known[1] or (not optimal and known[0] <= cost)):
+            return
+
+        entry_dir = self._entry_dir(graph)
+        os.makedirs(entry_dir, exist_ok=True)
+        kind = "optimal" if optimal else "bound"
+        record = {"cost": int(cost), "optimal": optimal, "solver": solver,
+                  "name": graph.name, "dimension": graph.dimension}
+        write_atomic(os.path.join(entry_dir, f"{int(cost)}-{kind}.json"),
+                     lambda f: f.write(json.dumps(record).encode()))
+
+    def optimal_cost(self, graph, exact_solver=None):
+        """Best known cost of graph, solving it with exact_solver first if its optimum is not stored.
+        A solver with a gap attribute (BranchAndBoundSolver) only records an optimum when the gap is 0."""
+        known = self.lookup(graph)
+        if exact_solver is not None and (known is None or not known[1]):
+            cost = graph.tour_cost(exact_solver.analyze(graph))
+            optimal = getattr(exact_solver, "gap", 0) == 0
+            self.record(graph, cost, optimal=optimal, solver=type(exact_solver).__name__)
+            known = self.lookup(graph)
+        return known[0] if known is not None else None
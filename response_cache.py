@@ -0,0 +1,39 @@
+import os
+import json
+
+from graph import write_atomic
+
+# Default location of the cache, shared by LLMSolver and AsyncLLMSolver
+RESPONSE_CACHE_DIR = ".llmcache"
+
+
+class ResponseCache:
+    """LLM responses keyed by (assistant, EuclideanTSPGraph.labelled_fingerprint(), prompt version, trial).
+
+    Every response is its own atomically written JSON file, so a benchmark can
+    be rerun (or replayed offline) from disk instead of the API. A response names
+    nodes by id, so the key covers the node ids and order, not just the points.
+    """
+
+    def __init__(self, directory=RESPONSE_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, assistant, graph, prompt_version, trial):
+        key = graph.labelled_fingerprint()
+        return os.path.join(self.directory, assistant, f"v{prompt_version}", key[:2], f"{key}-{trial}.json")
+
+    def lookup(self, assistant, graph, prompt_version, trial):
+        """Return the stored record (response, attempts, seconds, ...) or None."""
+        try:
+            with open(self._path(assistant, graph, prompt_version, trial)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def record(self, assistant, graph, prompt_version, trial, response, attempts=1, seconds=None):
+        """Store the accepted response of a trial, with the attempts and seconds it took."""
+        path = self._path(assistant, graph, prompt_version, trial)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = {"response": response, "attempts": attempts, "seconds": seconds,
+                  "name": graph.name, "dimension": graph.dimension}
+        write_atomic(path, lambda f: f.write(json.dumps(record).encode()))
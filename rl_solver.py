@@ -0,0 +1,70 @@
+import time
+
+import torch
+from torch_geometric.data import Batch
+
+from PtrNetwork import NEIGHBORS, graph_to_data
+from TSPRLAgent import TSPAgent
+from local_search import LocalSearch
+
+# Default checkpoint location, written by testRL.py
+RL_CHECKPOINT = "models/gatrl.pt"
+
+
+class GATRLSolver:
+    """Solves instances with a trained GAT + RL checkpoint (written by TSPAgent.save).
+
+    The checkpoint is loaded once and the model only runs under
+    torch.inference_mode(); load_time is kept apart from the per-instance
+    latencies so the model can be compared fairly with the heuristics.
+    """
+
+    def __init__(self, checkpoint, mode="greedy", beam_width=4, two_opt=False, compile=False,
+                 device='cpu', k=NEIGHBORS, max_batch=256, seed=None):
+        start = time.perf_counter()
+        self.agent = TSPAgent.load(checkpoint, device=device, seed=seed)
+        self.agent.model.eval()
+        if compile:
+            # torch.compile(model) would only compile forward(), which decoding never calls
+            model = self.agent.model
+            model.embed = torch.compile(model.embed)
+            model.logits = torch.compile(model.logits)
+            model.pointer.compile()
+        self.load_time = time.perf_counter() - start  # seconds
+
+        self.mode = mode  # "greedy", "sample", or "beam" (pointer decoder checkpoints)
+        self.beam_width = beam_width
+        self.k = k
+        self.max_batch = max_batch
+        self.search = LocalSearch(or_opt=False) if two_opt else None
+        self.latencies = []  # seconds per instance, one entry per solved graph
+
+    def reseed(self, seed):
+        self.agent.reseed(seed)
+
+    def analyze(self, graph):
+        return self.analyze_batch([graph])[0]
+
+    def analyze_many(self, graphs):
+        """(route, seconds) per graph, decoded by analyze_batch(); seconds is the graph's share of its batch."""
+        first = len(self.latencies)
+        routes = self.analyze_batch(graphs)
+        return list(zip(routes, self.latencies[first:]))
+
+    def analyze_batch(self, graphs):
+        """Tours for several graphs, decoded together in batches of up to max_batch."""
+        routes = []
+        for first in range(0, len(graphs), self.max_batch):
+            chunk = graphs[first:first + self.max_batch]
+            start = time.perf_counter()
+            with torch.inference_mode():
+                batch = Batch.from_data_list([graph_to_data(graph, self.k) for graph in chunk])
+                tours, _ = self.agent.decode(batch, self.mode, self.beam_width)
+            tours = tours.tolist()
+            for graph, tour in zip(chunk, tours):
+                route = [graph.node_ids[i] for i in tour[:graph.dimension]]
+                if self.search is not None:
+                    route = self.search.improve(graph, route)
+                routes.append(route)
+            self.latencies.extend([(time.perf_counter() - start) / len(chunk)] * len(chunk))
+        return routes
@@ -0,0 +1,29 @@
+import numpy as np
+
+
+def seed_sequence(seed):
+    """SeedSequence for any seed a solver or generator accepts: None, an int (or sequence of
+    ints), a SeedSequence, a seed_label() string, or a numpy Generator, which is advanced to
+    draw fresh entropy."""
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, str):
+        entropy, *spawn_key = seed.split("/")
+        return np.random.SeedSequence(int(entropy), spawn_key=[int(k) for k in spawn_key])
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(0, 2 ** 63, size=4).tolist())
+    return np.random.SeedSequence(seed)
+
+
+def int_seed(seed):
+    """A single integer for APIs such as torch's manual_seed; ints pass through unchanged."""
+    if isinstance(seed, (int, np.integer)):
+        return int(seed)
+    return int(seed_sequence(seed).generate_state(1, np.uint64)[0])
+
+
+def seed_label(seed):
+    """The entropy and spawn key of a seed as "entropy/key/...", which seed_sequence() turns back
+    into the same SeedSequence, so children spawned from two siblings stay distinct."""
+    seq = seed_sequence(seed)
+    return "/".join(str(part) for part in (seq.entropy, *seq.spawn_key))
@@ -0,0 +1,184 @@
+import math
+import numpy as np
+
+# Largest number of point-candidate distances knn() holds at once
+_CHUNK = 1 << 20
+
+
+class GridIndex:
+    """Grid over a set of 2-D points, about two points per cell.
+
+    Column and row edges sit at quantiles of the x and y coordinates rather
+    than evenly across the bounding box, so no row or column holds more than
+    about sqrt(2n) points however the points are spread, and a few outliers
+    cannot crowd the rest into one cell. Points are sorted by cell
+    (row-major), so every row of cells is one contiguous slice of the point
+    order and a square of cells is a handful of slices.
+    """
+
+    def __init__(self, coords):
+        self.coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        n = len(self.coords)
+        side = max(1, math.isqrt(n // 2))
+        quantiles = np.linspace(0, 1, side + 1)[1:-1]
+        # Column c spans [x_edges[c - 1], x_edges[c]), the outer columns reaching to infinity
+        self.x_edges = np.quantile(self.coords[:, 0], quantiles) if n else np.empty(0)
+        self.y_edges = np.quantile(self.coords[:, 1], quantiles) if n else np.empty(0)
+        self.shape = (side, side)  # (rows, columns)
+
+        cells = self.cell_of(self.coords)
+        self.cells = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self.order = np.argsort(self.cells, kind="stable")
+        self.starts = np.searchsorted(self.cells[self.order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def cell_of(self, points):
+        """(row, column) of the cell containing each point."""
+        points = np.asarray(points, dtype=float)
+        return np.stack([np.searchsorted(self.y_edges, points[..., 1], side="right"),
+                         np.searchsorted(self.x_edges, points[..., 0], side="right")], axis=-1)
+
+    def clearance(self, points, radius):
+        """Distance from each point (by index) to the edge of the square of cells within
+        Chebyshev distance radius of its own cell; every point outside the square is at least
+        this far away. Infinite when the square covers the whole grid."""
+        coords = self.coords[points]
+        row, column = np.divmod(self.cells[points], self.shape[1])
+        bound = np.full(len(coords), np.inf)
+        for edges, cell, values in ((self.x_edges, column, coords[:, 0]), (self.y_edges, row, coords[:, 1])):
+            low, high = cell - radius - 1, cell + radius
+            inside = low >= 0
+            bound[inside] = np.minimum(bound[inside], values[inside] - edges[low[inside]])
+            inside = high < len(edges)
+            bound[inside] = np.minimum(bound[inside], edges[high[inside]] - values[inside])
+        return bound
+
+    def square(self, row, column, radius):
+        """Indices of the points in the cells within Chebyshev distance radius of a cell."""
+        rows, columns = self.shape
+        first, last = max(column - radius, 0), min(column + radius, columns - 1)
+        parts = [self.order[self.starts[r * columns + first]:self.starts[r * columns + last + 1]]
+                 for r in range(max(row - radius, 0), min(row + radius, rows - 1) + 1)]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+
+    def knn(self, k):
+        """(n, k) indices of each point's k nearest other points, nearest first."""
+        n = len(self.coords)
+        k = min(k, n - 1)
+        result = np.empty((n, max(k, 0)), dtype=np.intp)
+        if k <= 0:
+            return result
+
+        columns = self.shape[1]
+        sorted_cells = self.cells[self.order]
+        # Grow each cell's square from this radius until every point's k-th nearest candidate
+        # is no farther than the square's edge, so no point outside it can be nearer
+        first_radius = max(1, math.ceil(math.sqrt((k + 1) / 2) / 2))
+        first_bound = self.clearance(np.arange(n), first_radius)
+        for cell in np.unique(sorted_cells):
+            pending = self.order[self.starts[cell]:self.starts[cell + 1]]
+            row, column = divmod(int(cell), columns)
+            radius = first_radius
+            while len(pending):
+                candidates = self.square(row, column, radius)
+                if len(candidates) > k:
+                    bound = first_bound[pending] if radius == first_radius else self.clearance(pending, radius)
+                    done = np.zeros(len(pending), dtype=bool)
+                    # Distances for a bounded chunk of points at a time
+                    step = max(1, _CHUNK // len(candidates))
+                    for start in range(0, len(pending), step):
+                        members = pending[start:start + step]
+                        diff = self.coords[members, None, :] - self.coords[None, candidates, :]
+                        dist = np.hypot(diff[..., 0], diff[..., 1])
+                        dist[members[:, None] == candidates[None, :]] = np.inf
+                        nearest = np.argsort(dist, axis=1, kind="stable")[:, :k]
+                        reach = np.take_along_axis(dist, nearest[:, -1:], axis=1)[:, 0]
+                        found = reach <= bound[start:start + step]
+                        result[members[found]] = candidates[nearest[found]]
+                        done[start:start + step] = found
+                    pending = pending[~done]
+                radius *= 2
+        return result
+
+    def active_set(self):
+        """Mutable set of all points supporting nearest-member queries."""
+        return ActiveSet(self)
+
+
+class ActiveSet:
+    """Subset of a GridIndex's points that shrinks as points are removed."""
+
+    def __init__(self, index):
+        self.index = index
+        self.active = np.ones(len(index.coords), dtype=bool)
+        self.counts = np.diff(index.starts).reshape(index.shape)  # active points per cell
+        self.size = len(index.coords)
+        self.x_edges, self.y_edges = index.x_edges.tolist(), index.y_edges.tolist()
+
+    def remove(self, point):
+        if self.active[point]:
+            self.active[point] = False
+            row, column = divmod(int(self.index.cells[point]), self.index.shape[1])
+            self.counts[row, column] -= 1
+            self.size -= 1
+
+    def add(self, point):
+        if not self.active[point]:
+            self.active[point] = True
+            row, column = divmod(int(self.index.cells[point]), self.index.shape[1])
+            self.counts[row, column] += 1
+            self.size += 1
+
+    def nearest(self, point):
+        """Active point nearest to the given point index (excluding itself), or None if empty."""
+        index = self.index
+        x, y = index.coords[point]
+        row, column = divmod(int(index.cells[point]), index.shape[1])
+        rows, columns = index.shape
+        best, best_dist = None, math.inf
+        radius = 0
+        while True:
+            # Only the ring of cells at exactly this radius is new
+            top, bottom = row - radius, row + radius
+            left, right = max(column - radius, 0), min(column + radius, columns - 1)
+            ring_rows = [r for r in (top, bottom) if 0 <= r < rows] if radius else [row]
+            slices = [(r, left, right) for r in dict.fromkeys(ring_rows)]
+            for c in (column - radius, column + radius) if radius else ():
+                if 0 <= c < columns:
+                    slices.extend((r, c, c) for r in range(max(top + 1, 0), min(bottom, rows)))
+
+            for r, first, last in slices:
+                if not self.counts[r, first:last + 1].any():
+                    continue
+                members = index.order[index.starts[r * columns + first]:index.starts[r * columns + last + 1]]
+                members = members[self.active[members] & (members != point)]
+                if len(members):
+                    dist = np.hypot(index.coords[members, 0] - x, index.coords[members, 1] - y)
+                    nearest = int(dist.argmin())
+                    if dist[nearest] < best_dist:
+                        best, best_dist = int(members[nearest]), dist[nearest]
+
+            if radius >= max(row, rows - 1 - row, column, columns - 1 - column):
+                return best
+            if best is not None:
+                # Same bound as GridIndex.clearance, in scalar form for this per-node query
+                bound = math.inf
+                for edges, cell, value in ((self.x_edges, column, x), (self.y_edges, row, y)):
+                    if cell - radius > 0:
+                        bound = min(bound, value - edges[cell - radius - 1])
+                    if cell + radius < len(edges):
+                        bound = min(bound, edges[cell + radius] - value)
+                if best_dist <= bound:
+                    return best
+            radius += 1
+
+    def within(self, point, radius):
+        """Active points (excluding the given point) within distance radius of it."""
+        index = self.index
+        row, column = divmod(int(index.cells[point]), index.shape[1])
+        cells = 0
+        while index.clearance([point], cells)[0] <= radius:
+            cells += 1
+        members = index.square(row, column, cells)
+        members = members[self.active[members] & (members != point)]
+        x, y = index.coords[point]
+        return members[np.hypot(index.coords[members, 0] - x, index.coords[members, 1] - y) <= radius]